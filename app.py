@@ -2,78 +2,333 @@ import os
 import streamlit as st
 import time
 import subprocess
-import uuid
 from pathlib import Path
 import shutil
 import sys
 import cv2
+from concurrent.futures import ThreadPoolExecutor
+import streamlit.components.v1 as components
 
-# Add src directory to path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Constants
+APP_DIR = Path(__file__).resolve().parent
+INPUT_DIR = APP_DIR / "input"
+SHM_INPUT_DIR = Path("/dev/shm/vr180_input")
+OUTPUTS_DIR = APP_DIR / "output"
+STREAM_DIR = OUTPUTS_DIR / "stream"
+FINAL_HLS_DIR = OUTPUTS_DIR / "final_hls"
+FINAL_HLS_PLAYLIST = FINAL_HLS_DIR / "output.m3u8"
+# FastAPI backend (main.py) serving OUTPUTS_DIR/final_hls under /hls_final with proper HLS MIME types
+BACKEND_URL = os.getenv("VR180_BACKEND_URL", "").rstrip("/")
+FINAL_HLS_URL = f"{BACKEND_URL}/hls_final/output.m3u8" if BACKEND_URL else None
+# Records which cached run the fixed output paths currently belong to
+RUN_KEY_FILE = OUTPUTS_DIR / ".run_key"
+POLL_INTERVAL_SECONDS = 2
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+LARGE_UPLOAD_BYTES = 2_000_000_000
 
-from src.main import main as process_main
-from src.anaglyph_processor import main_anaglyph
+# Add src directory to path (Streamlit re-executes this module on every rerun)
+if str(APP_DIR) not in sys.path:
+    sys.path.append(str(APP_DIR))
 
-# Constants
-APP_DIR = os.path.dirname(os.path.abspath(__file__))
-INPUT_DIR = os.path.join(APP_DIR, "input")
-OUTPUTS_DIR = os.path.join(APP_DIR, "output")
-STREAM_DIR = os.path.join(OUTPUTS_DIR, "stream")
-FINAL_HLS_DIR = os.path.join(OUTPUTS_DIR, "final_hls")
-
-# Ensure directories exist
-os.makedirs(INPUT_DIR, exist_ok=True)
-os.makedirs(OUTPUTS_DIR, exist_ok=True)
-os.makedirs(STREAM_DIR, exist_ok=True)
-os.makedirs(FINAL_HLS_DIR, exist_ok=True)
+@st.cache_resource
+def _init_dirs():
+    """Create the working directories once per server process, not on every rerun"""
+    for d in (INPUT_DIR, OUTPUTS_DIR, STREAM_DIR, FINAL_HLS_DIR):
+        d.mkdir(parents=True, exist_ok=True)
+    # No session exists yet, so anything left in tmpfs is from a previous server process
+    shutil.rmtree(SHM_INPUT_DIR, ignore_errors=True)
+
+_init_dirs()
+
+def _input_dir_for(size):
+    """Prefer tmpfs (/dev/shm) for uploads that fit comfortably, else the on-disk INPUT_DIR"""
+    try:
+        stats = os.statvfs("/dev/shm")
+    except (AttributeError, OSError):
+        return INPUT_DIR
+    # Leave headroom: tmpfs pages are RAM shared with the pipeline itself
+    if stats.f_bavail * stats.f_frsize < 2 * size:
+        return INPUT_DIR
+    try:
+        SHM_INPUT_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return INPUT_DIR
+    return SHM_INPUT_DIR
+
+def _in_shm(path):
+    return path is not None and Path(path).parent == SHM_INPUT_DIR
+
+def _discard_shm_input(path):
+    """Delete an upload held in tmpfs; its pages are RAM until unlinked"""
+    if _in_shm(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _move_input_to_disk(path):
+    """Move a tmpfs upload to INPUT_DIR once the pipeline no longer streams it; returns the new path"""
+    if not _in_shm(path) or not os.path.exists(path):
+        return path
+    dest = str(INPUT_DIR / os.path.basename(path))
+    shutil.move(path, dest)
+    return dest
 
 def save_uploaded_file(uploaded_file):
-    """Save uploaded file to input directory with a unique name"""
+    """Save uploaded file to input directory, named by its stable Streamlit file_id"""
     if not uploaded_file:
         return None
     
-    # Create a unique filename
+    # file_id is stable for an upload across reruns, so repeat saves are no-ops
     file_ext = os.path.splitext(uploaded_file.name)[1]
-    unique_filename = f"{uuid.uuid4().hex}{file_ext}"
-    file_path = os.path.join(INPUT_DIR, unique_filename)
+    unique_filename = f"{uploaded_file.file_id}{file_ext}"
+    file_path = str(_input_dir_for(uploaded_file.size) / unique_filename)
+    if os.path.exists(file_path) and os.path.getsize(file_path) == uploaded_file.size:
+        return file_path
     
-    # Save the file
+    # Stream the file to disk in chunks rather than materializing the whole buffer
+    uploaded_file.seek(0)
     with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+        shutil.copyfileobj(uploaded_file, f, length=UPLOAD_CHUNK_SIZE)
     
     return file_path
 
-def process_video(input_path, mode="vr180", add_audio=True):
-    """Process video using the appropriate processor"""
-    try:
-        # Clear previous output files
+def _reset_outputs():
+    """Drop the whole outputs tree (including stream/ segments) and recreate it"""
+    # Never wipe uploads, even if the directories are reconfigured to overlap
+    if INPUT_DIR.is_relative_to(OUTPUTS_DIR):
+        raise RuntimeError(f"Refusing to reset {OUTPUTS_DIR}: it contains INPUT_DIR")
+    shutil.rmtree(OUTPUTS_DIR, ignore_errors=True)
+    STREAM_DIR.mkdir(parents=True, exist_ok=True)
+    FINAL_HLS_DIR.mkdir(parents=True, exist_ok=True)
+
+def _process_video_impl(input_path, mode="vr180", add_audio=True, preview_fps=None):
+    """Process video using the appropriate processor.
+    preview_fps below the source rate makes the reader grab() skipped frames and
+    retrieve() only the kept ones.
+    """
+    # Clear previous output files
+    _reset_outputs()
+
+    # Process the video
+    # Imported lazily: the pipelines pull in torch, which reruns should not pay for
+    if mode == "vr180":
+        from src.main import main as process_main
+        output_path = process_main(input_path, add_audio=add_audio, preview_fps=preview_fps)
+    else:  # anaglyph
+        from src.anaglyph_processor import main_anaglyph
+        output_path = main_anaglyph(input_path, add_audio=add_audio, preview_fps=preview_fps)
+
+    # If output_path is None, try to find the output file
+    if output_path is None or not os.path.exists(output_path):
+        # Look for the output file in the output directory
         for f in os.listdir(OUTPUTS_DIR):
-            if f.endswith(('.mp4', '.m3u8', '.ts')):
-                try:
-                    os.remove(os.path.join(OUTPUTS_DIR, f))
-                except:
-                    pass
-        
-        # Process the video
-        if mode == "vr180":
-            output_path = process_main(input_path, add_audio=add_audio)
-        else:  # anaglyph
-            output_path = main_anaglyph(input_path, add_audio=add_audio)
-            
-        # If output_path is None, try to find the output file
-        if output_path is None or not os.path.exists(output_path):
-            # Look for the output file in the output directory
-            for f in os.listdir(OUTPUTS_DIR):
-                if f.startswith('final_output') and f.endswith('.mp4'):
-                    output_path = os.path.join(OUTPUTS_DIR, f)
-                    break
-        
-        return output_path if output_path and os.path.exists(output_path) else None
+            if f.startswith('final_output') and f.endswith('.mp4'):
+                output_path = str(OUTPUTS_DIR / f)
+                break
+
+    return output_path if output_path and os.path.exists(output_path) else None
+
+def _run_key(file_id, mode, add_audio, preview_fps):
+    return f"{file_id}|{mode}|{add_audio}|{preview_fps}"
+
+def _outputs_belong_to(run_key):
+    try:
+        return RUN_KEY_FILE.read_text() == run_key
+    except OSError:
+        return False
+
+@st.cache_data(show_spinner=False, persist="disk")
+def _process_video_cached(file_id, _input_path, mode, add_audio, preview_fps=None):
+    """Cached pipeline run keyed on (file_id, mode, add_audio, preview_fps); the path is not hashed"""
+    output_path = _process_video_impl(_input_path, mode=mode, add_audio=add_audio, preview_fps=preview_fps)
+    if output_path is None:
+        # Exceptions are never cached, so a failed run is retried on the next click
+        raise RuntimeError("Video processing produced no output")
+    # Every run writes the same fixed paths, so tag them with the run they now hold
+    RUN_KEY_FILE.write_text(_run_key(file_id, mode, add_audio, preview_fps))
+    return output_path
+
+def process_video(file_id, input_path, mode="vr180", add_audio=True, preview_fps=None):
+    """Process video, reusing the previous result for the same upload and settings.
+    Runs on the worker thread; pipeline exceptions propagate to the caller's Future
+    and are shown with st.error by the processed-video panel.
+    """
+    output_path = _process_video_cached(file_id, input_path, mode, add_audio, preview_fps)
+    if not os.path.exists(output_path) or not _outputs_belong_to(_run_key(file_id, mode, add_audio, preview_fps)):
+        # A later run replaced or wiped the outputs; drop stale entries and recompute
+        _process_video_cached.clear()
+        output_path = _process_video_cached(file_id, input_path, mode, add_audio, preview_fps)
+    return output_path
+
+@st.cache_data(show_spinner=False)
+def _make_poster(path, mtime):
+    """First-frame JPEG for the upload preview; mtime is part of the cache key"""
+    result = subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", "-ss", "0", "-i", path,
+         "-frames:v", "1", "-f", "image2pipe", "-vcodec", "mjpeg", "-"],
+        capture_output=True,
+    )
+    if result.returncode == 0 and result.stdout:
+        return result.stdout
+
+    # Fall back to decoding a single frame with OpenCV
+    cap = cv2.VideoCapture(path)
+    ok = cap.grab()
+    ok, frame = cap.retrieve() if ok else (False, None)
+    cap.release()
+    if not ok:
+        return None
+    ok, buf = cv2.imencode(".jpg", frame)
+    return buf.tobytes() if ok else None
+
+def render_hls_player(playlist_url, height=420):
+    """Embed an HLS player: native HLS where supported, hls.js elsewhere"""
+    components.html(f"""
+        <video id="player" controls playsinline style="width:100%;max-height:{height - 20}px"></video>
+        <script src="https://cdn.jsdelivr.net/npm/hls.js@1"></script>
+        <script>
+          const video = document.getElementById("player");
+          const src = "{playlist_url}";
+          if (video.canPlayType("application/vnd.apple.mpegurl")) {{
+            video.src = src;
+          }} else if (window.Hls && Hls.isSupported()) {{
+            const hls = new Hls();
+            hls.loadSource(src);
+            hls.attachMedia(video);
+          }}
+        </script>
+    """, height=height)
+
+def ingest_upload(uploaded_file, state):
+    """Save and validate a new upload exactly once, recording the result in state"""
+    state.update(fid=uploaded_file.file_id, name=uploaded_file.name, input=None, output=None, error=None)
+    try:
+        input_path = save_uploaded_file(uploaded_file)
+        if not input_path or not os.path.exists(input_path):
+            st.error("Failed to save the uploaded file. Please try again.")
+            return
+
+        # Verify the video file (grab() decodes one frame but skips the BGR conversion and copy)
+        cap = cv2.VideoCapture(input_path)
+        is_valid = cap.isOpened() and cap.grab()
+        cap.release()
+        if not is_valid:
+            st.error("Error: Could not read the video file. The file might be corrupted or in an unsupported format.")
+            return
+
+        state["input"] = input_path
     except Exception as e:
-        st.error(f"Error processing video: {str(e)}")
+        st.error(f"An error occurred: {str(e)}")
+        st.error("Please check the console for more details.")
         import traceback
-        st.error(traceback.format_exc())
-        return None
+        traceback.print_exc()
+
+@st.fragment
+def processing_options(state):
+    """Processing options; toggling them reruns only this fragment"""
+    st.subheader("Processing Options")
+    processing_mode = st.radio(
+        "Processing Mode:",
+        ["VR 180", "Anaglyph 3D"]
+    )
+
+    add_audio = st.checkbox("Include Audio", value=True)
+
+    process_button = st.button("Process Video", type="primary",
+                               disabled=state["input"] is None or state["future"] is not None)
+
+    if process_button:
+        # Run the pipeline on a worker thread so the UI keeps responding
+        if "executor" not in st.session_state:
+            st.session_state["executor"] = ThreadPoolExecutor(max_workers=1)
+        executor = st.session_state["executor"]
+        state.update(output=None, error=None, job_input=state["input"])
+        state["future"] = executor.submit(
+            process_video,
+            state["fid"],
+            state["input"],
+            mode=processing_mode.lower().replace(" ", ""),
+            add_audio=add_audio
+        )
+        # Full rerun so the processed-video panel starts polling
+        st.rerun()
+
+def processed_video_panel(state):
+    """Processed-video column; run as a polling fragment while a job is in flight"""
+    st.subheader("Processed Video")
+
+    future = state["future"]
+    if future is not None:
+        if not future.done():
+            segments = sum(1 for f in os.listdir(STREAM_DIR) if f.endswith(".ts")) if os.path.isdir(STREAM_DIR) else 0
+            st.info(f"Processing video... {segments} stream segments written so far. This may take a few minutes...")
+            return
+
+        state["future"] = None
+        try:
+            state["output"] = future.result()
+        except Exception as e:
+            import traceback
+            state["error"] = [f"Error processing video: {str(e)}", "".join(traceback.format_exception(e))]
+        # Free the tmpfs copy; later runs with other options read the upload from disk
+        job_input = state.pop("job_input", None)
+        if job_input != state["input"]:
+            _discard_shm_input(job_input)  # replaced or cleared while the job was reading it
+        else:
+            try:
+                state["input"] = _move_input_to_disk(job_input)
+            except OSError as e:
+                _discard_shm_input(job_input)
+                state["input"] = None
+                state["error"] = (state["error"] or []) + [f"Could not keep the upload for further runs: {str(e)}"]
+        if not state["output"] and not state["error"]:
+            state["error"] = ["Failed to process the video. The output file was not found.",
+                              "No output path was returned from the processing function."]
+        # Full rerun re-enables the Process button and stops polling
+        st.rerun()
+
+    if state["error"]:
+        for message in state["error"]:
+            st.error(message)
+
+        # List files in output directory for debugging
+        try:
+            output_files = os.listdir(OUTPUTS_DIR)
+            st.info(f"Files in output directory: {output_files}")
+        except Exception as e:
+            st.error(f"Could not list output directory: {str(e)}")
+
+    output_path = state["output"]
+    if output_path and os.path.exists(output_path):
+        st.success("Processing complete!")
+
+        # Display the processed video
+        try:
+            if FINAL_HLS_URL and os.path.exists(FINAL_HLS_PLAYLIST):
+                # HLS lets the browser fetch only the segments it plays
+                render_hls_player(FINAL_HLS_URL)
+                mp4_section = st.expander("Full MP4")
+            else:
+                mp4_section = st.container()
+
+            with mp4_section:
+                # Pass the path / file handle so Streamlit serves from disk
+                st.video(output_path)
+
+                # Add download button
+                with open(output_path, 'rb') as video_file:
+                    st.download_button(
+                        label="Download Processed Video",
+                        data=video_file,
+                        file_name=f"processed_{os.path.basename(state['name'])}",
+                        mime="video/mp4"
+                    )
+        except Exception as e:
+            st.error(f"Error displaying video: {str(e)}")
+            st.error(f"Output path: {output_path}")
+            if os.path.exists(output_path):
+                st.error(f"File exists: {os.path.getsize(output_path)} bytes")
 
 def main():
     st.set_page_config(
@@ -85,6 +340,11 @@ def main():
     st.title("🎥 VR 180 Video Processor")
     st.markdown("---")
 
+    # Single source of truth across reruns: uploaded -> processing -> processed
+    state = st.session_state.setdefault("video_state", {
+        "fid": None, "name": None, "input": None, "output": None, "future": None, "error": None
+    })
+
     # Sidebar for upload and settings
     with st.sidebar:
         st.header("Upload & Settings")
@@ -92,124 +352,43 @@ def main():
         # File uploader
         uploaded_file = st.file_uploader("Choose a video file", 
                                        type=["mp4", "avi", "mov", "mkv"])
-        
-        # Processing options
-        st.subheader("Processing Options")
-        processing_mode = st.radio(
-            "Processing Mode:",
-            ["VR 180", "Anaglyph 3D"]
+
+    if uploaded_file is not None and uploaded_file.size > LARGE_UPLOAD_BYTES:
+        st.warning(
+            f"This upload is {uploaded_file.size / 1e9:.1f} GB. Streamlit keeps uploads in memory, "
+            "so files this large need several GB of free RAM while they are saved and processed."
         )
-        
-        add_audio = st.checkbox("Include Audio", value=True)
-        
-        process_button = st.button("Process Video", type="primary", 
-                                 disabled=uploaded_file is None)
-    
+
+    if uploaded_file is None or uploaded_file.file_id != state["fid"]:
+        # The previous upload is gone or replaced; a job still reading it frees it when it finishes
+        if state["future"] is None:
+            _discard_shm_input(state["input"])
+    if uploaded_file is None:
+        state.update(fid=None, name=None, input=None, output=None, error=None)
+    elif uploaded_file.file_id != state["fid"]:
+        ingest_upload(uploaded_file, state)
+
+    with st.sidebar:
+        processing_options(state)
+
     # Main content area
     col1, col2 = st.columns(2)
-    
-    if uploaded_file is not None:
-        with st.spinner('Processing video...'):
-            try:
-                # Save the uploaded file
-                input_path = save_uploaded_file(uploaded_file)
-                if not input_path or not os.path.exists(input_path):
-                    st.error("Failed to save the uploaded file. Please try again.")
-                    return
-                    
-                # Verify the video file
-                cap = cv2.VideoCapture(input_path)
-                if not cap.isOpened() or not cap.read()[0]:
-                    st.error("Error: Could not read the video file. The file might be corrupted or in an unsupported format.")
-                    cap.release()
-                    return
-                cap.release()
-                
-                # Process the video
-                if process_button:
-                    with st.spinner('Processing video... This may take a while...'):
-                        output_path = process_video(
-                            input_path, 
-                            mode=processing_mode.lower().replace(" ", ""),
-                            add_audio=add_audio
-                        )
-                        
-                        if output_path and os.path.exists(output_path):
-                            st.success("Video processing completed successfully!")
-                            st.video(output_path)
-                            
-                            # Add download button
-                            with open(output_path, 'rb') as f:
-                                st.download_button(
-                                    label="Download Processed Video",
-                                    data=f,
-                                    file_name=os.path.basename(output_path),
-                                    mime="video/mp4"
-                                )
-                        else:
-                            st.error("Failed to process the video. Please check the logs for more details.")
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                st.error("Please check the console for more details.")
-                import traceback
-                traceback.print_exc()
-    
+
     with col1:
         st.subheader("Original Video")
-        if uploaded_file:
-            # Save the uploaded file
-            input_path = save_uploaded_file(uploaded_file)
-            if input_path:
-                st.video(input_path)
-    
+        if state["input"]:
+            # A single poster frame instead of shipping the whole upload to the browser
+            poster = _make_poster(state["input"], os.path.getmtime(state["input"]))
+            if poster:
+                st.image(poster)
+            with st.expander("Play original", expanded=not poster):
+                st.video(state["input"])
+
     with col2:
-        st.subheader("Processed Video")
-        
-        if process_button and uploaded_file:
-            with st.spinner("Processing video... This may take a few minutes..."):
-                # Process the video
-                output_path = process_video(
-                    input_path,
-                    mode=processing_mode.lower().replace(" ", ""),
-                    add_audio=add_audio
-                )
-                
-                if output_path and os.path.exists(output_path):
-                    st.success("Processing complete!")
-                    
-                    # Display the processed video
-                    try:
-                        video_file = open(output_path, 'rb')
-                        video_bytes = video_file.read()
-                        st.video(video_bytes)
-                        
-                        # Add download button
-                        st.download_button(
-                            label="Download Processed Video",
-                            data=video_bytes,
-                            file_name=f"processed_{os.path.basename(uploaded_file.name)}",
-                            mime="video/mp4"
-                        )
-                    except Exception as e:
-                        st.error(f"Error displaying video: {str(e)}")
-                        st.error(f"Output path: {output_path}")
-                        if os.path.exists(output_path):
-                            st.error(f"File exists: {os.path.getsize(output_path)} bytes")
-                else:
-                    st.error("Failed to process the video. The output file was not found.")
-                    st.error(f"Expected output path: {output_path}")
-                    if output_path:
-                        st.error(f"Output path exists: {os.path.exists(output_path)}")
-                    else:
-                        st.error("No output path was returned from the processing function.")
-                    
-                    # List files in output directory for debugging
-                    try:
-                        output_files = os.listdir(OUTPUTS_DIR)
-                        st.info(f"Files in output directory: {output_files}")
-                    except Exception as e:
-                        st.error(f"Could not list output directory: {str(e)}")
-    
+        # Only this column reruns while polling the worker
+        run_every = POLL_INTERVAL_SECONDS if state["future"] is not None else None
+        st.fragment(run_every=run_every)(processed_video_panel)(state)
+
     # Add some information
     with st.expander("ℹ️ About this App"):
         st.markdown("""
@@ -228,6 +407,10 @@ def main():
         2. Select processing mode (VR 180 or Anaglyph 3D)
         3. Click 'Process Video'
         4. Download the processed video
+
+        **Limits:** uploads of up to 4 GB are accepted (`server.maxUploadSize` in
+        `.streamlit/config.toml`). Uploads are held in memory while they are saved, so
+        very large files need a matching amount of free RAM.
         """)
 
 if __name__ == "__main__":
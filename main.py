@@ -1,25 +1,49 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query, BackgroundTasks, Request
-from fastapi.responses import StreamingResponse, FileResponse, Response
+from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+import anyio.to_thread
 import os
-import re
+import shutil
+import time
+import functools
 import httpx
 import logging
+import mimetypes
+import logging.handlers
+import queue
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import atexit
 import traceback
-from typing import Optional, Iterator
+from typing import Optional
+from contextlib import asynccontextmanager
+from starlette.background import BackgroundTask
 from src.main import main as process_main
 from src.anaglyph_processor import main_anaglyph
 from uuid import uuid4
-
-# Configure logging
+from watchfiles import awatch, Change
+from starlette.requests import ClientDisconnect
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.parser import ParseFailedException
+from streaming_form_data.targets import FileTarget
+
+# Configure logging: records are queued on the calling thread and written to the
+# file/console handlers by a background listener, so request handlers never block on log I/O
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [logging.FileHandler('backend.log'), logging.StreamHandler()]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('backend.log'),
-        logging.StreamHandler()
-    ]
+    format='%(message)s',  # the listener's handlers apply the real format
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
 logger = logging.getLogger(__name__)
 
@@ -29,6 +53,107 @@ APP_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_DIR = os.getenv("INPUT_DIR", os.path.join(APP_DIR, "input"))
 OUTPUTS_DIR = os.getenv("OUTPUTS_DIR", os.path.join(APP_DIR, "output"))
 STREAM_DIR = os.path.join(OUTPUTS_DIR, "stream")
+FINAL_HLS_DIR = os.path.join(OUTPUTS_DIR, "final_hls")
+# Fixed output paths polled by the frontend
+FINAL_VR180_PATH = os.path.join(OUTPUTS_DIR, "final_output_vr_180.mp4")
+FINAL_ANAGLYPH_PATH = os.path.join(OUTPUTS_DIR, "final_output_anaglyph.mp4")
+FINAL_HLS_PLAYLIST_PATH = os.path.join(FINAL_HLS_DIR, "output.m3u8")
+# Transfer buffer sizes for large video bodies
+UPLOAD_CHUNK = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+PROXY_CHUNK = int(os.getenv("PROXY_CHUNK_SIZE", 1024 * 1024))
+# Worker threads available to run_in_threadpool / sync endpoints (anyio default is 40)
+ANYIO_TOKENS = int(os.getenv("ANYIO_TOKENS", 100))
+# Worker processes for the VR180/anaglyph pipelines (created in lifespan)
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", 2))
+PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+
+
+# Short-lived memoization of stat lookups on the fixed pipeline paths polled by the
+# frontend; the bucket argument rolls over once per second so results stay fresh.
+@functools.lru_cache(maxsize=64)
+def _isdir_cached(path: str, bucket: int) -> bool:
+    return os.path.isdir(path)
+
+
+@functools.lru_cache(maxsize=64)
+def _exists_cached(path: str, bucket: int) -> bool:
+    return os.path.exists(path)
+
+
+def _isdir(path: str) -> bool:
+    return _isdir_cached(path, int(time.monotonic()))
+
+
+def _exists(path: str) -> bool:
+    if _WATCH_ACTIVE and path in _PATH_EXISTS:
+        return _PATH_EXISTS[path]
+    return _exists_cached(path, int(time.monotonic()))
+
+
+# Existence of the fixed output files, kept current by a filesystem watcher on OUTPUTS_DIR
+# while it runs; _exists() falls back to the stat cache whenever the watcher is down.
+_PATH_EXISTS = {}
+_WATCH_ACTIVE = False
+WATCH_CHECK_MS = 1000
+WATCH_RETRY_SECONDS = 5
+
+
+def _preload_path_state() -> None:
+    for path in (FINAL_VR180_PATH, FINAL_ANAGLYPH_PATH, FINAL_HLS_PLAYLIST_PATH,
+                 os.path.join(STREAM_DIR, "output.m3u8")):
+        _PATH_EXISTS[path] = os.path.exists(path)
+    logger.debug("Preloaded path state: %s", _PATH_EXISTS)
+
+
+def _dir_identity(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+async def _watch_outputs(stop_event: asyncio.Event) -> None:
+    """Update _PATH_EXISTS from inotify-style events instead of stat'ing on every poll.
+
+    The pipelines rmtree OUTPUTS_DIR on every run, which silently ends the watch on it, so the
+    watch is re-armed when the directory itself is reported deleted or its identity changes.
+    """
+    global _WATCH_ACTIVE
+    root = os.path.abspath(OUTPUTS_DIR)
+    while not stop_event.is_set():
+        try:
+            os.makedirs(OUTPUTS_DIR, exist_ok=True)
+            armed = _dir_identity(OUTPUTS_DIR)
+            # yield_on_timeout wakes the loop every WATCH_CHECK_MS even without events; the first
+            # wakeup means the watch is live, so a preload from then on cannot miss a change
+            async for changes in awatch(OUTPUTS_DIR, watch_filter=None, stop_event=stop_event,
+                                        rust_timeout=WATCH_CHECK_MS, yield_on_timeout=True):
+                root_deleted = any(c == Change.deleted and os.path.abspath(p) == root for c, p in changes)
+                if root_deleted or _dir_identity(OUTPUTS_DIR) != armed:
+                    logger.info("%s was replaced; re-arming output watcher", OUTPUTS_DIR)
+                    break
+                if not _WATCH_ACTIVE:
+                    _preload_path_state()
+                    _WATCH_ACTIVE = True
+                    logger.info("Watching %s for output changes", OUTPUTS_DIR)
+                    continue
+                for change, path in changes:
+                    if path in _PATH_EXISTS:
+                        _PATH_EXISTS[path] = change != Change.deleted
+                        logger.debug("Path state changed: %s -> %s", path, _PATH_EXISTS[path])
+        except Exception as e:
+            logger.error("Output watcher stopped: %s", e)
+            logger.error(traceback.format_exc())
+            # Serve from the stat cache for a while before trying again
+            _WATCH_ACTIVE = False
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=WATCH_RETRY_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            _WATCH_ACTIVE = False
+
 
 def _find_hls_dir() -> str:
     """Find HLS directory with comprehensive logging and error handling."""
@@ -39,25 +164,72 @@ def _find_hls_dir() -> str:
             os.path.join(APP_DIR, "output", "stream"),
             os.path.join(APP_DIR, "src", "output", "stream"),
         ]
-        logger.debug(f"HLS directory candidates: {candidates}")
+        logger.debug("HLS directory candidates: %s", candidates)
         
         for d in candidates:
-            if os.path.isdir(d):
-                logger.info(f"Found HLS directory: {d}")
+            if _isdir(d):
+                logger.info("Found HLS directory: %s", d)
                 return d
         # Default to first path; created on demand later by pipeline
-        logger.warning(f"No existing HLS directory found, using default: {candidates[0]}")
+        logger.warning("No existing HLS directory found, using default: %s", candidates[0])
         return candidates[0]
     except Exception as e:
-        logger.error(f"Error finding HLS directory: {e}")
+        logger.error("Error finding HLS directory: %s", e)
         logger.error(traceback.format_exc())
         # Fallback to first candidate
         return os.path.join(APP_DIR, "output", "stream")
 
 HLS_DIR = _find_hls_dir()
+# Kept in step with HLS_DIR whenever the incremental HLS directory is (re)mounted
+HLS_PLAYLIST_PATH = os.path.join(HLS_DIR, "output.m3u8")
+# Mount points attached so far, so status polls skip scanning app.routes
+_MOUNTED = set()
 
 
-app = FastAPI(title="VR 180 Backend", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Process-wide resources: widened anyio thread pool and a shared HTTP client for /proxy."""
+    try:
+        # Worker threads for sync endpoints, FileResponse and upload copies
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        limiter.total_tokens = ANYIO_TOKENS
+        logger.info("anyio thread limiter set to %s tokens", ANYIO_TOKENS)
+    except Exception as e:
+        logger.error("Failed to raise anyio thread limiter: %s", e)
+        logger.error(traceback.format_exc())
+
+    # Pooled keep-alive (and HTTP/2 where the upstream supports it) across proxy requests
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=None,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    logger.info("Shared HTTP client created")
+
+    global PROCESS_POOL
+    # spawn rather than fork: the parent already runs the event loop and logging threads
+    PROCESS_POOL = ProcessPoolExecutor(
+        max_workers=PROCESS_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    logger.info("Process pool started with %s workers", PROCESS_WORKERS)
+
+    stop_watch = asyncio.Event()
+    watch_task = asyncio.create_task(_watch_outputs(stop_watch))
+    try:
+        yield
+    finally:
+        stop_watch.set()
+        await watch_task
+        await app.state.http.aclose()
+        logger.info("Shared HTTP client closed")
+        PROCESS_POOL.shutdown(wait=False, cancel_futures=True)
+        PROCESS_POOL = None
+        logger.info("Process pool shut down")
+
+
+app = FastAPI(title="VR 180 Backend", version="0.1.0", lifespan=lifespan)
 
 logger.info("Initializing FastAPI application")
 
@@ -71,47 +243,53 @@ try:
     )
     logger.info("CORS middleware added successfully")
 except Exception as e:
-    logger.error(f"Failed to add CORS middleware: {e}")
+    logger.error("Failed to add CORS middleware: %s", e)
     logger.error(traceback.format_exc())
 
+# StaticFiles picks Content-Type from mimetypes, whose system tables may lack or misassign the HLS
+# extensions (.ts is commonly mapped to Qt translation files)
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
 # Ensure base dirs exist at startup and mount HLS
 try:
     logger.info("Creating base directories")
     os.makedirs(INPUT_DIR, exist_ok=True)
     os.makedirs(OUTPUTS_DIR, exist_ok=True)
     os.makedirs(STREAM_DIR, exist_ok=True)
-    logger.info(f"Created directories: INPUT_DIR={INPUT_DIR}, OUTPUTS_DIR={OUTPUTS_DIR}, STREAM_DIR={STREAM_DIR}")
+    logger.info("Created directories: INPUT_DIR=%s, OUTPUTS_DIR=%s, STREAM_DIR=%s", INPUT_DIR, OUTPUTS_DIR, STREAM_DIR)
 except Exception as e:
-    logger.error(f"Failed to create base directories: {e}")
+    logger.error("Failed to create base directories: %s", e)
     logger.error(traceback.format_exc())
 
 # Create storage directory for Render
 try:
     STORAGE_DIR = os.getenv("STORAGE_DIR", os.path.join(APP_DIR, "storage"))
     os.makedirs(STORAGE_DIR, exist_ok=True)
-    logger.info(f"Created storage directory: {STORAGE_DIR}")
+    logger.info("Created storage directory: %s", STORAGE_DIR)
 except Exception as e:
-    logger.error(f"Failed to create storage directory: {e}")
+    logger.error("Failed to create storage directory: %s", e)
     logger.error(traceback.format_exc())
 
 try:
     if os.path.isdir(HLS_DIR):
         app.mount("/hls", StaticFiles(directory=HLS_DIR), name="hls")
-        logger.info(f"Mounted HLS directory: {HLS_DIR}")
+        _MOUNTED.add("/hls")
+        logger.info("Mounted HLS directory: %s", HLS_DIR)
     else:
-        logger.warning(f"HLS directory does not exist: {HLS_DIR}")
+        logger.warning("HLS directory does not exist: %s", HLS_DIR)
 except Exception as e:
-    logger.error(f"Failed to mount HLS directory: {e}")
+    logger.error("Failed to mount HLS directory: %s", e)
     logger.error(traceback.format_exc())
 
 # Mount final HLS directory (created after finalize step)
 try:
-    FINAL_HLS_DIR = os.path.join(OUTPUTS_DIR, "final_hls")
     os.makedirs(FINAL_HLS_DIR, exist_ok=True)
     app.mount("/hls_final", StaticFiles(directory=FINAL_HLS_DIR), name="hls_final")
-    logger.info(f"Mounted final HLS directory: {FINAL_HLS_DIR}")
+    _MOUNTED.add("/hls_final")
+    logger.info("Mounted final HLS directory: %s", FINAL_HLS_DIR)
 except Exception as e:
-    logger.error(f"Failed to mount final HLS directory: {e}")
+    logger.error("Failed to mount final HLS directory: %s", e)
     logger.error(traceback.format_exc())
 
 
@@ -124,29 +302,191 @@ def health() -> dict:
         logger.info("Health check successful")
         return result
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
+        logger.error("Health check failed: %s", e)
         logger.error(traceback.format_exc())
         return {"status": "error", "message": str(e)}
 
 
+def _stat_first(*paths: str):
+    """Return (path, os.stat_result) for the first existing path, or (None, None).
+    One stat per candidate; callers hand the result to FileResponse so it does not stat again.
+    """
+    for path in paths:
+        try:
+            return path, os.stat(path)
+        except FileNotFoundError:
+            continue
+    return None, None
+
+
+# Set after the first successful ensure_dirs(); later calls from request handlers are free
+_DIRS_READY = False
+
+
 def ensure_dirs() -> None:
     """Ensure all required directories exist with logging."""
+    global _DIRS_READY
+    if _DIRS_READY:
+        return
     logger.info("Ensuring directories exist")
     try:
         os.makedirs(INPUT_DIR, exist_ok=True)
         os.makedirs(OUTPUTS_DIR, exist_ok=True)
         os.makedirs(STREAM_DIR, exist_ok=True)
-        logger.info(f"Directories ensured: INPUT_DIR={INPUT_DIR}, OUTPUTS_DIR={OUTPUTS_DIR}, STREAM_DIR={STREAM_DIR}")
+        _DIRS_READY = True
+        logger.info("Directories ensured: INPUT_DIR=%s, OUTPUTS_DIR=%s, STREAM_DIR=%s", INPUT_DIR, OUTPUTS_DIR, STREAM_DIR)
     except Exception as e:
-        logger.error(f"Failed to ensure directories: {e}")
+        logger.error("Failed to ensure directories: %s", e)
         logger.error(traceback.format_exc())
         raise
 
 
+def _log_process_result(future) -> None:
+    try:
+        future.result()
+        logger.info("Background pipeline finished")
+    except Exception as e:
+        logger.error("Background pipeline failed: %s", e)
+
+
+def _submit_process(fn, *args) -> None:
+    """Run a pipeline entry point in the process pool so it never holds this process's GIL."""
+    if PROCESS_POOL is None:
+        logger.warning("Process pool unavailable; running %s in-process", fn.__name__)
+        fn(*args)
+        return
+    future = PROCESS_POOL.submit(fn, *args)
+    future.add_done_callback(_log_process_result)
+    logger.info("Submitted %s to process pool", fn.__name__)
+
+
+def _copy_upload_file(src, dest_path: str) -> int:
+    """Copy a spooled upload to dest_path and return the number of bytes written.
+    When the SpooledTemporaryFile has rolled over to disk, the copy is done in-kernel
+    with os.sendfile; otherwise fall back to a buffered copy.
+    """
+    with open(dest_path, "wb") as out:
+        if getattr(src, "_rolled", False) and hasattr(os, "sendfile"):
+            src.flush()
+            in_fd = src.fileno()
+            out_fd = out.fileno()
+            size = os.fstat(in_fd).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return offset
+
+        src.seek(0)
+        shutil.copyfileobj(src, out, UPLOAD_CHUNK)
+        return out.tell()
+
+
+async def _save_upload(upload: UploadFile, dest_path: str) -> int:
+    """Write an UploadFile to dest_path (replacing any existing file), then close it.
+    Returns the number of bytes written; failures surface as HTTP 500.
+    """
+    try:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        total_bytes = await run_in_threadpool(_copy_upload_file, upload.file, dest_path)
+        logger.info("Saved upload %s: %s bytes -> %s", upload.filename, total_bytes, dest_path)
+        return total_bytes
+    except Exception as e:
+        logger.error("Failed to save upload %s: %s", upload.filename, e)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Save failed: {e}")
+    finally:
+        try:
+            await upload.close()
+        except Exception as e:
+            logger.warning("Failed to close upload file handle: %s", e)
+
+
+def _feed_parser(parser: StreamingFormDataParser, chunks: list) -> None:
+    for chunk in chunks:
+        parser.data_received(chunk)
+
+
+async def _stream_upload(request: Request) -> Optional[str]:
+    """Parse a multipart body straight into input/ without Starlette spooling it first.
+    Returns the saved path, or None when the body carries no 'file' part.
+    """
+    tmp_path = os.path.join(INPUT_DIR, f".upload_{uuid4().hex}.part")
+    target = FileTarget(tmp_path)
+    stored = False
+    try:
+        parser = StreamingFormDataParser(headers=request.headers)
+        parser.register("file", target)
+        # Parsing and file writes are blocking; hand them to the threadpool in batches
+        pending, pending_bytes, total_bytes = [], 0, 0
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            pending.append(chunk)
+            pending_bytes += len(chunk)
+            if pending_bytes >= UPLOAD_CHUNK:
+                await run_in_threadpool(_feed_parser, parser, pending)
+                total_bytes += pending_bytes
+                pending, pending_bytes = [], 0
+        if pending:
+            await run_in_threadpool(_feed_parser, parser, pending)
+            total_bytes += pending_bytes
+        stored = bool(target.multipart_filename)
+    except (ParseFailedException, ClientDisconnect) as e:
+        # Malformed or truncated body: the client's fault
+        logger.error("Failed to parse multipart upload: %s", e)
+        raise HTTPException(status_code=400, detail=f"Upload parse failed: {e}")
+    except OSError as e:
+        # Writing the part failed (disk full, permissions): a server fault
+        logger.error("Failed to store multipart upload: %s", e)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Could not store the upload")
+    finally:
+        # The parser only closes the file when the part ends; close it before any unlink
+        target.on_finish()
+        if not stored and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if not stored:
+        return None
+
+    dest_path = os.path.join(INPUT_DIR, os.path.basename(target.multipart_filename))
+    os.replace(tmp_path, dest_path)
+    logger.info("Streamed upload %s: %s body bytes -> %s", target.multipart_filename, total_bytes, dest_path)
+    return dest_path
+
+
+async def _resolve_process_input(request: Request, filename: Optional[str]) -> str:
+    """Shared input handling for the /process endpoints.
+    Saves an uploaded file under input/, or resolves an existing filename there.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        streamed_path = await _stream_upload(request)
+        if streamed_path:
+            return streamed_path
+
+    if not filename:
+        logger.error("No file or filename provided")
+        raise HTTPException(status_code=400, detail="Provide either file or filename")
+
+    # filename may arrive quoted from some UIs; strip quotes if present
+    cleaned = filename.strip('"')
+    candidate = os.path.join(INPUT_DIR, os.path.basename(cleaned))
+    logger.info("Processing existing file: %s -> %s", filename, candidate)
+    if not os.path.exists(candidate):
+        logger.error("File not found: %s", candidate)
+        raise HTTPException(status_code=404, detail="Filename not found under input/")
+    return candidate
+
+
 @app.post("/upload")
 async def upload_video(file: UploadFile = File(...)) -> dict:
     """Accept a multipart video file and store it under input/"""
-    logger.info(f"Upload endpoint called with file: {file.filename}")
+    logger.info("Upload endpoint called with file: %s", file.filename)
     try:
         ensure_dirs()
         
@@ -159,159 +499,56 @@ async def upload_video(file: UploadFile = File(...)) -> dict:
         unique_name = f"{name}_{uuid4().hex[:8]}{ext or ''}"
         dest_path = os.path.join(INPUT_DIR, unique_name)
         
-        logger.info(f"Processing upload: original_name={file.filename}, unique_name={unique_name}, dest_path={dest_path}")
-        
-        try:
-            with open(dest_path, "wb") as f:
-                chunk_count = 0
-                total_bytes = 0
-                while True:
-                    chunk = await file.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    chunk_count += 1
-                    total_bytes += len(chunk)
-                    if chunk_count % 10 == 0:  # Log every 10 chunks
-                        logger.debug(f"Upload progress: {chunk_count} chunks, {total_bytes} bytes")
-                
-                logger.info(f"Upload completed: {chunk_count} chunks, {total_bytes} bytes written to {dest_path}")
-        except Exception as e:
-            logger.error(f"File write failed: {e}")
-            logger.error(traceback.format_exc())
-            raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
-        finally:
-            try:
-                await file.close()
-                logger.debug("File handle closed successfully")
-            except Exception as e:
-                logger.warning(f"Failed to close file handle: {e}")
+        logger.info("Processing upload: original_name=%s, unique_name=%s, dest_path=%s", file.filename, unique_name, dest_path)
+        await _save_upload(file, dest_path)
         
         result = {"filename": unique_name, "path": dest_path}
-        logger.info(f"Upload successful: {result}")
+        logger.info("Upload successful: %s", result)
         return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in upload: {e}")
+        logger.error("Unexpected error in upload: %s", e)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
 
 
-def iter_file_range(path: str, start: int, end: int, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
-    """Iterate over file range with logging and error handling."""
-    logger.debug(f"Starting file range iteration: path={path}, start={start}, end={end}, chunk_size={chunk_size}")
-    try:
-        with open(path, "rb") as f:
-            f.seek(start)
-            remaining = end - start + 1
-            chunk_count = 0
-            total_yielded = 0
-            
-            while remaining > 0:
-                read_size = min(chunk_size, remaining)
-                data = f.read(read_size)
-                if not data:
-                    logger.warning(f"No more data to read at position {f.tell()}")
-                    break
-                yield data
-                remaining -= len(data)
-                chunk_count += 1
-                total_yielded += len(data)
-                
-                if chunk_count % 100 == 0:  # Log every 100 chunks
-                    logger.debug(f"File range progress: {chunk_count} chunks, {total_yielded} bytes yielded")
-            
-            logger.debug(f"File range iteration completed: {chunk_count} chunks, {total_yielded} bytes total")
-    except Exception as e:
-        logger.error(f"Error in file range iteration: {e}")
-        logger.error(traceback.format_exc())
-        raise
-
-
-range_re = re.compile(r"bytes=(\d+)-(\d*)")
-
-
 @app.get("/stream")
 def stream_file(filename: str = Query(..., description="Filename in input/ or output/")):
     """HTTP range streaming for a local file.
     Priority search in output/ then input/.
+    Range handling is delegated to Starlette's FileResponse.
     """
-    logger.info(f"Stream endpoint called with filename: {filename}")
+    logger.info("Stream endpoint called with filename: %s", filename)
     try:
         # Backward-compat: accept old name without underscore
         base = os.path.basename(filename)
         if base == "final_output_vr180.mp4":
             base = "final_output_vr_180.mp4"
-            logger.debug(f"Applied backward compatibility: {filename} -> {base}")
+            logger.debug("Applied backward compatibility: %s -> %s", filename, base)
         
         outputs_path = os.path.join(OUTPUTS_DIR, base)
         input_path = os.path.join(INPUT_DIR, base)
-        path = outputs_path if os.path.exists(outputs_path) else input_path
+        path, stat_result = _stat_first(outputs_path, input_path)
         
-        logger.debug(f"File search: outputs_path={outputs_path}, input_path={input_path}, selected={path}")
+        logger.debug("File search: outputs_path=%s, input_path=%s, selected=%s", outputs_path, input_path, path)
         
-        if not os.path.exists(path):
-            logger.error(f"File not found: {path}")
+        if path is None:
+            logger.error("File not found: %s", input_path)
             raise HTTPException(status_code=404, detail="File not found")
 
-        file_size = os.path.getsize(path)
         content_type = "video/mp4" if path.lower().endswith(".mp4") else "application/octet-stream"
-        logger.info(f"File found: {path}, size={file_size}, content_type={content_type}")
-
-        # Manually parse Range header from the ASGI scope via dependency injection
-        # FastAPI exposes headers on the request object; we can access it via request in a dependency
-        from fastapi import Request
+        logger.info("File found: %s, size=%s, content_type=%s", path, stat_result.st_size, content_type)
 
-        async def _range_response(request: Request):
-            logger.debug(f"Range response called for {path}")
-            try:
-                range_header = request.headers.get("range")
-                logger.debug(f"Range header: {range_header}")
-                
-                if range_header is None:
-                    logger.info("No range header, returning full file")
-                    return FileResponse(path, media_type=content_type)
-
-                match = range_re.match(range_header)
-                if not match:
-                    logger.warning(f"Invalid range header format: {range_header}")
-                    return Response(status_code=416)
-                
-                start = int(match.group(1))
-                end = match.group(2)
-                end = int(end) if end else file_size - 1
-                
-                logger.debug(f"Parsed range: start={start}, end={end}, file_size={file_size}")
-                
-                if start >= file_size or end >= file_size or start > end:
-                    logger.warning(f"Invalid range: start={start}, end={end}, file_size={file_size}")
-                    return Response(status_code=416)
-
-                response = StreamingResponse(
-                    iter_file_range(path, start, end),
-                    media_type=content_type,
-                    status_code=206,
-                )
-                response.headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-                response.headers["Accept-Ranges"] = "bytes"
-                response.headers["Content-Length"] = str(end - start + 1)
-                
-                logger.info(f"Range response created: {start}-{end}/{file_size}")
-                return response
-                
-            except Exception as e:
-                logger.error(f"Error in range response: {e}")
-                logger.error(traceback.format_exc())
-                return Response(status_code=500)
-
-        return _range_response
+        # FileResponse honours Range itself (206 + Content-Range, 416 when unsatisfiable)
+        # and streams the body from the file without a Python-level chunk generator.
+        return FileResponse(path, media_type=content_type, stat_result=stat_result)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in stream endpoint: {e}")
+        logger.error("Unexpected error in stream endpoint: %s", e)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Stream failed: {e}")
 
@@ -321,44 +558,47 @@ def hls_refresh() -> dict:
     """Ensure HLS static mount is attached if the directory now exists."""
     logger.info("HLS refresh endpoint called")
     try:
-        global HLS_DIR
+        global HLS_DIR, HLS_PLAYLIST_PATH
         new_dir = _find_hls_dir()
-        mounted = any([r.path == "/hls" for r in getattr(app, "routes", [])])
+        mounted = "/hls" in _MOUNTED
+        new_dir_exists = _isdir(new_dir)
         
-        logger.debug(f"HLS directory check: new_dir={new_dir}, mounted={mounted}")
+        logger.debug("HLS directory check: new_dir=%s, mounted=%s", new_dir, mounted)
         
-        if os.path.isdir(new_dir) and not mounted:
-            logger.info(f"Mounting HLS directory: {new_dir}")
+        if new_dir_exists and not mounted:
+            logger.info("Mounting HLS directory: %s", new_dir)
             app.mount("/hls", StaticFiles(directory=new_dir), name="hls")
             HLS_DIR = new_dir
+            HLS_PLAYLIST_PATH = os.path.join(new_dir, "output.m3u8")
+            _MOUNTED.add("/hls")
         else:
-            logger.debug(f"HLS directory not mounted: isdir={os.path.isdir(new_dir)}, mounted={mounted}")
+            logger.debug("HLS directory not mounted: isdir=%s, mounted=%s", new_dir_exists, mounted)
         
         # Try mounting final hls as well
-        global FINAL_HLS_DIR
-        final_dir = os.path.join(OUTPUTS_DIR, "final_hls")
-        final_mounted = any([r.path == "/hls_final" for r in getattr(app, "routes", [])])
+        final_dir = FINAL_HLS_DIR
+        final_mounted = "/hls_final" in _MOUNTED
         
-        logger.debug(f"Final HLS directory check: final_dir={final_dir}, final_mounted={final_mounted}")
+        logger.debug("Final HLS directory check: final_dir=%s, final_mounted=%s", final_dir, final_mounted)
         
-        if os.path.isdir(final_dir) and not final_mounted:
-            logger.info(f"Mounting final HLS directory: {final_dir}")
+        final_dir_exists = _isdir(final_dir)
+        if final_dir_exists and not final_mounted:
+            logger.info("Mounting final HLS directory: %s", final_dir)
             app.mount("/hls_final", StaticFiles(directory=final_dir), name="hls_final")
-            FINAL_HLS_DIR = final_dir
+            _MOUNTED.add("/hls_final")
         else:
-            logger.debug(f"Final HLS directory not mounted: isdir={os.path.isdir(final_dir)}, final_mounted={final_mounted}")
+            logger.debug("Final HLS directory not mounted: isdir=%s, final_mounted=%s", final_dir_exists, final_mounted)
         
         result = {
-            "mounted": os.path.isdir(new_dir), 
-            "final_mounted": os.path.isdir(final_dir), 
+            "mounted": new_dir_exists, 
+            "final_mounted": final_dir_exists, 
             "dir": new_dir, 
             "final_dir": final_dir
         }
-        logger.info(f"HLS refresh result: {result}")
+        logger.info("HLS refresh result: %s", result)
         return result
         
     except Exception as e:
-        logger.error(f"Error in HLS refresh: {e}")
+        logger.error("Error in HLS refresh: %s", e)
         logger.error(traceback.format_exc())
         return {"error": str(e), "mounted": False, "final_mounted": False, "dir": "", "final_dir": ""}
 
@@ -367,25 +607,27 @@ def _ensure_hls_mounted_and_path() -> str:
     """Ensure HLS is mounted and return playlist path if present, else empty string."""
     logger.debug("Ensuring HLS is mounted and getting playlist path")
     try:
-        global HLS_DIR
+        global HLS_DIR, HLS_PLAYLIST_PATH
         new_dir = _find_hls_dir()
-        mounted = any([r.path == "/hls" for r in getattr(app, "routes", [])])
+        mounted = "/hls" in _MOUNTED
         
-        logger.debug(f"HLS mount check: new_dir={new_dir}, mounted={mounted}")
+        logger.debug("HLS mount check: new_dir=%s, mounted=%s", new_dir, mounted)
         
-        if os.path.isdir(new_dir) and not mounted:
-            logger.info(f"Mounting HLS directory: {new_dir}")
+        if not mounted and _isdir(new_dir):
+            logger.info("Mounting HLS directory: %s", new_dir)
             app.mount("/hls", StaticFiles(directory=new_dir), name="hls")
             HLS_DIR = new_dir
+            HLS_PLAYLIST_PATH = os.path.join(new_dir, "output.m3u8")
+            _MOUNTED.add("/hls")
         
-        playlist = os.path.join(HLS_DIR, "output.m3u8") if HLS_DIR else ""
-        exists = playlist and os.path.exists(playlist)
+        playlist = HLS_PLAYLIST_PATH if HLS_DIR else ""
+        exists = playlist and _exists(playlist)
         
-        logger.debug(f"Playlist check: playlist={playlist}, exists={exists}")
+        logger.debug("Playlist check: playlist=%s, exists=%s", playlist, exists)
         return playlist if exists else ""
         
     except Exception as e:
-        logger.error(f"Error ensuring HLS mount: {e}")
+        logger.error("Error ensuring HLS mount: %s", e)
         logger.error(traceback.format_exc())
         return ""
 
@@ -396,30 +638,30 @@ def hls_manifest() -> dict:
     logger.info("HLS manifest endpoint called")
     try:
         playlist_fs = _ensure_hls_mounted_and_path()
-        logger.debug(f"Incremental HLS playlist: {playlist_fs}")
+        logger.debug("Incremental HLS playlist: %s", playlist_fs)
         
         # Prefer final HLS when available
-        final_playlist = os.path.join(FINAL_HLS_DIR, "output.m3u8")
-        final_exists = os.path.exists(final_playlist)
-        logger.debug(f"Final HLS playlist: {final_playlist}, exists: {final_exists}")
+        final_playlist = FINAL_HLS_PLAYLIST_PATH
+        final_exists = _exists(final_playlist)
+        logger.debug("Final HLS playlist: %s, exists: %s", final_playlist, final_exists)
         
         if final_exists:
             result = {"ready": True, "url": "/hls_final/output.m3u8", "type": "final"}
-            logger.info(f"Returning final HLS manifest: {result}")
+            logger.info("Returning final HLS manifest: %s", result)
             return result
         
         # Fall back to incremental HLS
         if not playlist_fs:
             result = {"ready": False, "url": None}
-            logger.info(f"No HLS playlist available: {result}")
+            logger.info("No HLS playlist available: %s", result)
             return result
         
         result = {"ready": True, "url": "/hls/output.m3u8", "type": "incremental"}
-        logger.info(f"Returning incremental HLS manifest: {result}")
+        logger.info("Returning incremental HLS manifest: %s", result)
         return result
         
     except Exception as e:
-        logger.error(f"Error in HLS manifest: {e}")
+        logger.error("Error in HLS manifest: %s", e)
         logger.error(traceback.format_exc())
         return {"ready": False, "url": None, "error": str(e)}
 
@@ -429,23 +671,23 @@ def stream_status(mode: str = Query("vr180", description="Processing mode: vr180
     """Report availability of both HLS playlist and final MP4 for the frontend to poll.
     Frontend can call this every ~40 seconds.
     """
-    logger.info(f"Stream status endpoint called with mode: {mode}")
+    logger.info("Stream status endpoint called with mode: %s", mode)
     try:
         # Ensure dirs and possible HLS mount
         ensure_dirs()
         playlist_fs = _ensure_hls_mounted_and_path()
         hls_exists = bool(playlist_fs)
         
-        logger.debug(f"HLS status: playlist_fs={playlist_fs}, hls_exists={hls_exists}")
+        logger.debug("HLS status: playlist_fs=%s, hls_exists=%s", playlist_fs, hls_exists)
         
         # Check for appropriate output file based on mode
         if mode == "anaglyph":
-            mp4_path = os.path.join(OUTPUTS_DIR, "final_output_anaglyph.mp4")
+            mp4_path = FINAL_ANAGLYPH_PATH
         else:
-            mp4_path = os.path.join(OUTPUTS_DIR, "final_output_vr_180.mp4")
+            mp4_path = FINAL_VR180_PATH
         
-        mp4_exists = os.path.exists(mp4_path)
-        logger.debug(f"MP4 status: mp4_path={mp4_path}, mp4_exists={mp4_exists}")
+        mp4_exists = _exists(mp4_path)
+        logger.debug("MP4 status: mp4_path=%s, mp4_exists=%s", mp4_path, mp4_exists)
         
         result = {
             "hls": {"exists": hls_exists, "url": "/hls/output.m3u8" if hls_exists else None},
@@ -453,11 +695,11 @@ def stream_status(mode: str = Query("vr180", description="Processing mode: vr180
             "mode": mode
         }
         
-        logger.info(f"Stream status result: {result}")
+        logger.info("Stream status result: %s", result)
         return result
         
     except Exception as e:
-        logger.error(f"Error in stream status: {e}")
+        logger.error("Error in stream status: %s", e)
         logger.error(traceback.format_exc())
         return {
             "hls": {"exists": False, "url": None},
@@ -469,87 +711,89 @@ def stream_status(mode: str = Query("vr180", description="Processing mode: vr180
 
 @app.get("/download")
 def download_file(filename: str = Query(..., description="Filename in outputs/ or input/")):
-    logger.info(f"Download endpoint called with filename: {filename}")
+    logger.info("Download endpoint called with filename: %s", filename)
     try:
         outputs_path = os.path.join(OUTPUTS_DIR, os.path.basename(filename))
         input_path = os.path.join(INPUT_DIR, os.path.basename(filename))
-        path = outputs_path if os.path.exists(outputs_path) else input_path
+        path, stat_result = _stat_first(outputs_path, input_path)
         
-        logger.debug(f"File search: outputs_path={outputs_path}, input_path={input_path}, selected={path}")
+        logger.debug("File search: outputs_path=%s, input_path=%s, selected=%s", outputs_path, input_path, path)
         
-        if not os.path.exists(path):
-            logger.error(f"File not found: {path}")
+        if path is None:
+            logger.error("File not found: %s", input_path)
             raise HTTPException(status_code=404, detail="File not found")
         
         media_type = "video/mp4" if path.lower().endswith(".mp4") else "application/octet-stream"
-        logger.info(f"File found: {path}, media_type={media_type}")
+        logger.info("File found: %s, media_type=%s", path, media_type)
         
-        return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+        return FileResponse(path, media_type=media_type, filename=os.path.basename(path), stat_result=stat_result)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in download: {e}")
+        logger.error("Unexpected error in download: %s", e)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Download failed: {e}")
 
 
 @app.get("/proxy")
-async def proxy_stream(url: str = Query(..., description="Remote video URL to proxy")):
+async def proxy_stream(request: Request, url: str = Query(..., description="Remote video URL to proxy")):
     """Stream or download a remote resource via proxy with chunked transfer."""
-    logger.info(f"Proxy endpoint called with URL: {url}")
+    logger.info("Proxy endpoint called with URL: %s", url)
     try:
+        client: httpx.AsyncClient = request.app.state.http
+        # Open the upstream response before replying so its status and headers are known up front
         try:
-            client = httpx.AsyncClient(timeout=None, follow_redirects=True)
-            logger.debug("HTTP client created successfully")
+            # Forward Range so seeks in the proxied video are served as partial content upstream
+            upstream_headers = {}
+            if "range" in request.headers:
+                upstream_headers["Range"] = request.headers["range"]
+            resp = await client.send(client.build_request("GET", url, headers=upstream_headers), stream=True)
         except Exception as e:
-            logger.error(f"Failed to create HTTP client: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+            logger.error("Failed to reach upstream %s: %s", url, e)
+            raise HTTPException(status_code=502, detail=f"Upstream request failed: {e}")
+
+        logger.debug("Proxy response status: %s", resp.status_code)
+        if resp.status_code >= 400:
+            await resp.aclose()
+            logger.error("Upstream error: %s", resp.status_code)
+            raise HTTPException(status_code=resp.status_code, detail="Upstream error")
 
         async def _gen():
-            logger.debug(f"Starting proxy stream for: {url}")
+            logger.debug("Starting proxy stream for: %s", url)
             try:
-                async with client.stream("GET", url) as resp:
-                    logger.debug(f"Proxy response status: {resp.status_code}")
-                    if resp.status_code >= 400:
-                        logger.error(f"Upstream error: {resp.status_code}")
-                        raise HTTPException(status_code=resp.status_code, detail="Upstream error")
-                    
-                    chunk_count = 0
-                    total_bytes = 0
-                    async for chunk in resp.aiter_bytes(chunk_size=1024 * 64):
-                        if chunk:
-                            chunk_count += 1
-                            total_bytes += len(chunk)
-                            if chunk_count % 100 == 0:  # Log every 100 chunks
-                                logger.debug(f"Proxy progress: {chunk_count} chunks, {total_bytes} bytes")
-                            yield chunk
-                    
-                    logger.info(f"Proxy stream completed: {chunk_count} chunks, {total_bytes} bytes")
+                # Raw bytes: no decompression, so upstream Content-Length/Encoding stay valid
+                async for chunk in resp.aiter_raw(chunk_size=PROXY_CHUNK):
+                    if chunk:
+                        yield chunk
+                logger.info("Proxy stream completed: %s", url)
             except Exception as e:
-                logger.error(f"Error in proxy stream: {e}")
+                logger.error("Error in proxy stream: %s", e)
                 logger.error(traceback.format_exc())
                 raise
 
-        headers = {}
-        # Best-effort content-type passthrough
-        try:
-            logger.debug("Attempting to get content type from HEAD request")
-            async with client.head(url) as head_resp:
-                ctype = head_resp.headers.get("content-type")
-                if ctype:
-                    headers["Content-Type"] = ctype
-                    logger.debug(f"Content type detected: {ctype}")
-        except Exception as e:
-            logger.warning(f"Failed to get content type: {e}")
-
-        logger.info(f"Starting proxy response with headers: {headers}")
-        return StreamingResponse(_gen(), headers=headers)
+        # Pass through the headers a player needs to size and seek the stream
+        headers = {
+            name: resp.headers[name]
+            for name in ("content-length", "content-range", "accept-ranges", "content-encoding")
+            if name in resp.headers
+        }
+        media_type = resp.headers.get("content-type", "application/octet-stream")
+        logger.debug("Content type detected: %s", media_type)
+
+        logger.info("Starting proxy response: status=%s, headers=%s", resp.status_code, headers)
+        return StreamingResponse(
+            _gen(),
+            status_code=resp.status_code,
+            headers=headers,
+            media_type=media_type,
+            background=BackgroundTask(resp.aclose),
+        )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in proxy: {e}")
+        logger.error("Unexpected error in proxy: %s", e)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Proxy failed: {e}")
 
@@ -565,90 +809,24 @@ async def process_video(
     Accepts either an uploaded file (multipart) or a filename already present in input/.
     Tolerates empty/absent file fields.
     """
-    logger.info(f"Process endpoint called with filename: {filename}, add_audio: {add_audio}")
+    logger.info("Process endpoint called with filename: %s, add_audio: %s", filename, add_audio)
     try:
         ensure_dirs()
 
-        # Try to read an optional file from multipart form without triggering validation errors
-        upload: Optional[UploadFile] = None
-        try:
-            logger.debug("Attempting to read multipart form")
-            form = await request.form()
-            maybe_file = form.get("file")
-            if isinstance(maybe_file, UploadFile) and getattr(maybe_file, "filename", None):
-                upload = maybe_file
-                logger.info(f"Found uploaded file: {upload.filename}")
-            else:
-                logger.debug("No valid file found in form")
-        except Exception as e:
-            logger.warning(f"Failed to read form data: {e}")
-            upload = None
-
-        if upload is None and not filename:
-            logger.error("No file or filename provided")
-            raise HTTPException(status_code=400, detail="Provide either file or filename")
-
-        input_path: Optional[str] = None
-        if upload is not None:
-            safe_name = os.path.basename(upload.filename)
-            input_path = os.path.join(INPUT_DIR, safe_name)
-            logger.info(f"Processing uploaded file: {upload.filename} -> {input_path}")
-            try:
-                # Overwrite if exists
-                if os.path.exists(input_path):
-                    logger.debug(f"Removing existing file: {input_path}")
-                    os.remove(input_path)
-                
-                chunk_count = 0
-                total_bytes = 0
-                with open(input_path, "wb") as f:
-                    while True:
-                        chunk = await upload.read(1024 * 1024)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        chunk_count += 1
-                        total_bytes += len(chunk)
-                        if chunk_count % 10 == 0:  # Log every 10 chunks
-                            logger.debug(f"Upload progress: {chunk_count} chunks, {total_bytes} bytes")
-                
-                logger.info(f"File saved successfully: {chunk_count} chunks, {total_bytes} bytes")
-            except Exception as e:
-                logger.error(f"Failed to save uploaded file: {e}")
-                logger.error(traceback.format_exc())
-                raise HTTPException(status_code=500, detail=f"Save failed: {e}")
-            finally:
-                try:
-                    await upload.close()
-                    logger.debug("Upload file handle closed")
-                except Exception as e:
-                    logger.warning(f"Failed to close upload file handle: {e}")
-        else:
-            # filename may arrive quoted from some UIs; strip quotes if present
-            assert filename is not None
-            cleaned = filename.strip('"')
-            safe_name = os.path.basename(cleaned)
-            candidate = os.path.join(INPUT_DIR, safe_name)
-            logger.info(f"Processing existing file: {filename} -> {candidate}")
-            
-            if not os.path.exists(candidate):
-                logger.error(f"File not found: {candidate}")
-                raise HTTPException(status_code=404, detail="Filename not found under input/")
-            input_path = candidate
+        input_path = await _resolve_process_input(request, filename)
 
         # Delegate to pipeline in background
-        assert input_path is not None
-        logger.info(f"Starting background processing: {input_path}, add_audio: {add_audio}")
-        background_tasks.add_task(process_main, input_path, add_audio)
+        logger.info("Starting background processing: %s, add_audio: %s", input_path, add_audio)
+        background_tasks.add_task(_submit_process, process_main, input_path, add_audio)
         
         result = {"status": "accepted", "input": input_path, "add_audio": add_audio}
-        logger.info(f"Process request accepted: {result}")
+        logger.info("Process request accepted: %s", result)
         return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in process endpoint: {e}")
+        logger.error("Unexpected error in process endpoint: %s", e)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Process failed: {e}")
 
@@ -663,90 +841,24 @@ async def process_anaglyph_video(
     """Process video for anaglyph 3D effect.
     Accepts either an uploaded file (multipart) or a filename already present in input/.
     """
-    logger.info(f"Process anaglyph endpoint called with filename: {filename}, add_audio: {add_audio}")
+    logger.info("Process anaglyph endpoint called with filename: %s, add_audio: %s", filename, add_audio)
     try:
         ensure_dirs()
 
-        # Try to read an optional file from multipart form without triggering validation errors
-        upload: Optional[UploadFile] = None
-        try:
-            logger.debug("Attempting to read multipart form for anaglyph")
-            form = await request.form()
-            maybe_file = form.get("file")
-            if isinstance(maybe_file, UploadFile) and getattr(maybe_file, "filename", None):
-                upload = maybe_file
-                logger.info(f"Found uploaded file for anaglyph: {upload.filename}")
-            else:
-                logger.debug("No valid file found in form for anaglyph")
-        except Exception as e:
-            logger.warning(f"Failed to read form data for anaglyph: {e}")
-            upload = None
-
-        if upload is None and not filename:
-            logger.error("No file or filename provided for anaglyph")
-            raise HTTPException(status_code=400, detail="Provide either file or filename")
-
-        input_path: Optional[str] = None
-        if upload is not None:
-            safe_name = os.path.basename(upload.filename)
-            input_path = os.path.join(INPUT_DIR, safe_name)
-            logger.info(f"Processing uploaded file for anaglyph: {upload.filename} -> {input_path}")
-            try:
-                # Overwrite if exists
-                if os.path.exists(input_path):
-                    logger.debug(f"Removing existing file for anaglyph: {input_path}")
-                    os.remove(input_path)
-                
-                chunk_count = 0
-                total_bytes = 0
-                with open(input_path, "wb") as f:
-                    while True:
-                        chunk = await upload.read(1024 * 1024)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        chunk_count += 1
-                        total_bytes += len(chunk)
-                        if chunk_count % 10 == 0:  # Log every 10 chunks
-                            logger.debug(f"Anaglyph upload progress: {chunk_count} chunks, {total_bytes} bytes")
-                
-                logger.info(f"File saved successfully for anaglyph: {chunk_count} chunks, {total_bytes} bytes")
-            except Exception as e:
-                logger.error(f"Failed to save uploaded file for anaglyph: {e}")
-                logger.error(traceback.format_exc())
-                raise HTTPException(status_code=500, detail=f"Save failed: {e}")
-            finally:
-                try:
-                    await upload.close()
-                    logger.debug("Anaglyph upload file handle closed")
-                except Exception as e:
-                    logger.warning(f"Failed to close anaglyph upload file handle: {e}")
-        else:
-            # filename may arrive quoted from some UIs; strip quotes if present
-            assert filename is not None
-            cleaned = filename.strip('"')
-            safe_name = os.path.basename(cleaned)
-            candidate = os.path.join(INPUT_DIR, safe_name)
-            logger.info(f"Processing existing file for anaglyph: {filename} -> {candidate}")
-            
-            if not os.path.exists(candidate):
-                logger.error(f"File not found for anaglyph: {candidate}")
-                raise HTTPException(status_code=404, detail="Filename not found under input/")
-            input_path = candidate
+        input_path = await _resolve_process_input(request, filename)
 
         # Delegate to anaglyph pipeline in background
-        assert input_path is not None
-        logger.info(f"Starting background anaglyph processing: {input_path}, add_audio: {add_audio}")
-        background_tasks.add_task(main_anaglyph, input_path, add_audio)
+        logger.info("Starting background anaglyph processing: %s, add_audio: %s", input_path, add_audio)
+        background_tasks.add_task(_submit_process, main_anaglyph, input_path, add_audio)
         
         result = {"status": "accepted", "input": input_path, "add_audio": add_audio, "mode": "anaglyph"}
-        logger.info(f"Anaglyph process request accepted: {result}")
+        logger.info("Anaglyph process request accepted: %s", result)
         return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in anaglyph process endpoint: {e}")
+        logger.error("Unexpected error in anaglyph process endpoint: %s", e)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Anaglyph process failed: {e}")
 
@@ -756,10 +868,11 @@ if __name__ == "__main__":
     try:
         port = int(os.getenv("PORT", "8000"))
         reload = os.getenv("RELOAD", "0") == "1"
-        logger.info(f"Starting FastAPI server on port {port}, reload={reload}")
-        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=reload)
+        logger.info("Starting FastAPI server on port %s, reload=%s", port, reload)
+        # uvloop + httptools ship with uvicorn[standard]; keep render.yaml's startCommand in sync
+        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=reload, loop="uvloop", http="httptools")
     except Exception as e:
-        logger.error(f"Failed to start server: {e}")
+        logger.error("Failed to start server: %s", e)
         logger.error(traceback.format_exc())
         raise
 
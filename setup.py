@@ -10,7 +10,6 @@ setup(
         'torch',
         'torchvision',
         'pyyaml',
-        'numba',
     ],
     entry_points={
         'console_scripts': [
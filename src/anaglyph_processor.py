@@ -1,159 +1,87 @@
 import os
 import cv2
-import numpy as np
 import shutil
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from .utils import load_config, ensure_dirs
-from .video_reader import read_and_write_batches, extract_audio
+from .video_reader import read_batches, extract_audio
 from .midas_depth import Midas, ModelType
-from .stereo import batch_generate_stereo
+from .stereo import generate_stereo_batch
 from .projection import batch_project
-from .frames_to_video import frames_to_segment
-from .audio_utils import extract_audio, mux_audio_to_video
+from .frames_to_video import RawVideoEncoder
+from .audio_utils import extract_audio
 from .streaming import add_batch_to_hls
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def create_anaglyph_from_stereo(left_path, right_path, output_path):
-    """Create anaglyph image from left and right eye images"""
-    logger.debug(f"Creating anaglyph from stereo: left={left_path}, right={right_path}, output={output_path}")
-    try:
-        left = cv2.imread(left_path)
-        right = cv2.imread(right_path)
-        
-        if left is None or right is None:
-            logger.warning(f"Skipping {left_path} or {right_path}, could not read image.")
-            return False
-
-        logger.debug(f"Successfully loaded images: left shape={left.shape}, right shape={right.shape}")
+ANAGLYPH_WORKERS = min(8, os.cpu_count() or 1)
 
-        # Create anaglyph: Red from left eye, Green and Blue from right eye
-        anaglyph = np.zeros_like(left)
-        anaglyph[:, :, 0] = left[:, :, 2]   # Red channel from left eye
-        anaglyph[:, :, 1] = right[:, :, 1]  # Green from right eye
-        anaglyph[:, :, 2] = right[:, :, 0]  # Blue from right eye
-
-        logger.debug(f"Created anaglyph with shape: {anaglyph.shape}")
-        
-        success = cv2.imwrite(output_path, anaglyph)
-        if success:
-            logger.debug(f"Successfully saved anaglyph: {output_path}")
-        else:
-            logger.error(f"Failed to save anaglyph: {output_path}")
-        
-        return success
-        
-    except Exception as e:
-        logger.error(f"Error creating anaglyph from stereo: {e}")
-        logger.error(traceback.format_exc())
-        return False
+def mux_anaglyph(left, right):
+    """Channel-mux a stereo pair: Red from left eye, Green and Blue from right eye.
+    cv2.merge writes the destination in one pass instead of zero-fill plus three channel copies.
+    """
+    return cv2.merge([left[:, :, 2], right[:, :, 1], right[:, :, 0]])
 
 def process_anaglyph_batch(batch_tuple, midas_obj, cfg):
-    """Process a batch of frames for anaglyph generation"""
-    batch_idx, start_frame, end_frame, frames = batch_tuple
-    logger.info(f"Processing anaglyph batch {batch_idx} frames {start_frame}-{end_frame} ({len(frames)})")
+    """Process a batch of decoded frames (BGR ndarrays) for anaglyph generation.
+    Returns the batch's anaglyph frames as BGR ndarrays plus its (start, end) frame range.
+    """
+    batch_idx, start_frame, end_frame, frame_arrays = batch_tuple
+    logger.info(f"Processing anaglyph batch {batch_idx} frames {start_frame}-{end_frame} ({len(frame_arrays)})")
     
     try:
-        # Output folder structure for this batch
-        batch_prefix = f"batch_{batch_idx:03d}"
-        depth_out = os.path.join(cfg["paths"]["depth_dir"], batch_prefix)
-        left_out = os.path.join(cfg["paths"]["left_dir"], batch_prefix)
-        right_out = os.path.join(cfg["paths"]["right_dir"], batch_prefix)
-        anaglyph_out = os.path.join(cfg["paths"]["anaglyph_dir"], batch_prefix)
-        frames_combined = os.path.join(cfg["paths"]["tmp_dir"], batch_prefix, "frames")
-        
-        logger.debug(f"Batch directories: depth_out={depth_out}, left_out={left_out}, right_out={right_out}, anaglyph_out={anaglyph_out}, frames_combined={frames_combined}")
-        
-        os.makedirs(frames_combined, exist_ok=True)
-        logger.debug("Created frames_combined directory")
+        # Frames arrive decoded from the VideoCapture; depth and stereo stay in memory from here on
 
         # 1) Depth estimation
         logger.info(f"Starting depth estimation for batch {batch_idx}")
         try:
-            midas_obj.predict_batch(frames, depth_out)
+            depth_maps = midas_obj.predict_frames(frame_arrays)
             logger.info(f"Depth estimation completed for batch {batch_idx}")
         except Exception as e:
             logger.error(f"Depth estimation failed for batch {batch_idx}: {e}")
             logger.error(traceback.format_exc())
             raise
 
-        # 2) Stereo generation
+        # 2) Stereo generation, kept in memory as (B, H, W, 3) stacks
         logger.info(f"Starting stereo generation for batch {batch_idx}")
         try:
-            depth_map_dict = {os.path.basename(p): os.path.join(depth_out, os.path.basename(p)) for p in frames}
-            batch_generate_stereo(frames, depth_map_dict, left_out, right_out, max_shift=cfg["processing"]["max_shift"])
+            left_stack, right_stack = generate_stereo_batch(frame_arrays, depth_maps, max_shift=cfg["processing"]["max_shift"], inpaint=cfg["processing"].get("inpaint", False))
             logger.info(f"Stereo generation completed for batch {batch_idx}")
         except Exception as e:
             logger.error(f"Stereo generation failed for batch {batch_idx}: {e}")
             logger.error(traceback.format_exc())
             raise
 
-        # 3) Create anaglyph images from left and right stereo pairs
+        # 3) Create anaglyph frames in parallel; they go straight to the encoders, never to disk
         logger.info(f"Starting anaglyph creation for batch {batch_idx}")
         try:
-            left_files = sorted([f for f in os.listdir(left_out) if f.lower().endswith(".png")])
-            right_files = sorted([f for f in os.listdir(right_out) if f.lower().endswith(".png")])
-            
-            logger.debug(f"Found {len(left_files)} left files and {len(right_files)} right files")
-            
-            os.makedirs(anaglyph_out, exist_ok=True)
-            
-            anaglyph_count = 0
-            for left_file, right_file in zip(left_files, right_files):
-                left_path = os.path.join(left_out, left_file)
-                right_path = os.path.join(right_out, right_file)
-                anaglyph_path = os.path.join(anaglyph_out, f"anaglyph_{left_file}")
-                
-                if create_anaglyph_from_stereo(left_path, right_path, anaglyph_path):
-                    anaglyph_count += 1
-                else:
-                    logger.warning(f"Failed to create anaglyph for {left_file}")
-            
-            logger.info(f"Created {anaglyph_count} anaglyph images for batch {batch_idx}")
+            # cv2.merge releases the GIL, so the per-frame muxes overlap across cores
+            with ThreadPoolExecutor(max_workers=ANAGLYPH_WORKERS) as pool:
+                anaglyphs = list(pool.map(mux_anaglyph, left_stack, right_stack))
+            logger.info(f"Created {len(anaglyphs)} anaglyph frames for batch {batch_idx}")
         except Exception as e:
             logger.error(f"Anaglyph creation failed for batch {batch_idx}: {e}")
             logger.error(traceback.format_exc())
             raise
 
-        # 4) Copy anaglyph frames to frames_combined (ensure zeros-based ordering)
-        logger.info(f"Copying anaglyph frames for batch {batch_idx}")
-        try:
-            anaglyph_files = sorted([f for f in os.listdir(anaglyph_out) if f.lower().endswith(".png")])
-            logger.debug(f"Found {len(anaglyph_files)} anaglyph files to copy")
-            
-            for i, f in enumerate(anaglyph_files):
-                src = os.path.join(anaglyph_out, f)
-                dst = os.path.join(frames_combined, f"frame_{i:06d}.png")
-                shutil.copy(src, dst)
-            
-            logger.info(f"Copied {len(anaglyph_files)} anaglyph frames to frames_combined")
-        except Exception as e:
-            logger.error(f"Failed to copy anaglyph frames for batch {batch_idx}: {e}")
-            logger.error(traceback.format_exc())
-            raise
-
         logger.info(f"Successfully completed anaglyph batch {batch_idx}")
-        return frames_combined, (start_frame, end_frame)
+        return anaglyphs, (start_frame, end_frame)
         
     except Exception as e:
         logger.error(f"Error processing anaglyph batch {batch_idx}: {e}")
         logger.error(traceback.format_exc())
         raise
 
-def main_anaglyph(input_video, add_audio=True):
+def main_anaglyph(input_video, add_audio=True, preview_fps=None):
     """Main function for anaglyph processing"""
     cfg = load_config()
     BATCH_SIZE = cfg["video"]["batch_size"]
     FPS = cfg["video"]["output_fps"]
     TMP = cfg["paths"]["tmp_dir"]
     
-    # Add anaglyph directory to config paths
-    anaglyph_dir = os.path.join(TMP, "anaglyph")
-    cfg["paths"]["anaglyph_dir"] = anaglyph_dir
-    
-    ensure_dirs(TMP, anaglyph_dir)
+    ensure_dirs(TMP)
     
     print("Reading video and splitting into batches for anaglyph processing...")
     
@@ -172,10 +100,9 @@ def main_anaglyph(input_video, add_audio=True):
     except Exception as e:
         print(f"Warning: failed to reset output/tmp dirs: {e}")
     
-    frames_dir = cfg["paths"]["frames_dir"]
-    ensure_dirs(frames_dir)
-    batches, fps, total_frames, w, h = read_and_write_batches(input_video, frames_dir, batch_size=BATCH_SIZE)
-    print(f"Total frames: {total_frames}, FPS detected: {fps}, total batches: {len(batches)}")
+    # Frames are decoded batch by batch as the loop below consumes them, never dumped to PNG
+    batches, fps, total_frames, w, h = read_batches(input_video, batch_size=BATCH_SIZE, sample_fps=preview_fps)
+    print(f"Total frames: {total_frames}, FPS detected: {fps}, batch size: {BATCH_SIZE}")
 
     # Prepare MiDaS model
     midas = Midas(ModelType[cfg["processing"]["midas_model"] if cfg["processing"]["midas_model"] in ModelType.__members__ else "MIDAS_SMALL"])
@@ -185,41 +112,43 @@ def main_anaglyph(input_video, add_audio=True):
     if add_audio:
         extract_audio(input_video, audio_temp)
 
-    # Accumulate all anaglyph frames from batches
-    all_frames_dir = os.path.join(TMP, "all_anaglyph_frames")
-    if os.path.exists(all_frames_dir):
-        shutil.rmtree(all_frames_dir)
-    os.makedirs(all_frames_dir, exist_ok=True)
-
-    next_index = 0
-    for i, batch in enumerate(batches):
-        frames_dir_batch, (sframe, eframe) = process_anaglyph_batch(batch, midas, cfg)
-        batch_files = sorted([f for f in os.listdir(frames_dir_batch) if f.lower().endswith(".png")])
-        for f in batch_files:
-            src = os.path.join(frames_dir_batch, f)
-            dst = os.path.join(all_frames_dir, f"frame_{next_index:06d}.png")
-            shutil.copy(src, dst)
-            next_index += 1
-        print(f"Anaglyph batch {sframe}-{eframe} appended. Total frames so far: {next_index}")
-
-        # Update HLS after each batch by rendering a small MP4 for this batch and appending to HLS
-        try:
-            tmp_batch_mp4 = os.path.join(TMP, f"anaglyph_batch_{i:03d}.mp4")
-            frames_to_segment(frames_dir_batch, tmp_batch_mp4, fps=FPS, codec=cfg["video"]["codec"], bitrate=cfg["ffmpeg"]["bitrate"])
-            hls_dir = os.path.join(os.path.dirname(cfg["paths"]["final_output"]), "stream")
-            add_batch_to_hls(tmp_batch_mp4, stream_dir=hls_dir, fps=FPS)
-        except Exception as e:
-            print(f"Warning: HLS append failed for anaglyph batch {i}: {e}")
-
-    # Render final anaglyph video from all frames
+    # One persistent ffmpeg fed raw frames for the final video, opened once the frame size is known
     combined_out = cfg["paths"]["final_output"].replace(".mp4", "_anaglyph.mp4")
-    frames_to_segment(all_frames_dir, combined_out, fps=FPS, codec=cfg["video"]["codec"], bitrate=cfg["ffmpeg"]["bitrate"])
+    final_encoder = None
+    frames_written = 0
+    try:
+        for i, batch in enumerate(batches):
+            anaglyphs, (sframe, eframe) = process_anaglyph_batch(batch, midas, cfg)
+            frame_h, frame_w = anaglyphs[0].shape[:2]
+            if final_encoder is None:
+                final_encoder = RawVideoEncoder(
+                    combined_out, frame_w, frame_h, fps=FPS, codec=cfg["video"]["codec"], bitrate=cfg["ffmpeg"]["bitrate"],
+                    faststart=True, audio_path=audio_temp if add_audio else None,
+                )
+            for frame in anaglyphs:
+                final_encoder.write(frame)
+            frames_written += len(anaglyphs)
+            print(f"Anaglyph batch {sframe}-{eframe} appended. Total frames so far: {frames_written}")
+
+            # Update HLS after each batch by rendering a small MP4 for this batch and appending to HLS
+            try:
+                tmp_batch_mp4 = os.path.join(TMP, f"anaglyph_batch_{i:03d}.mp4")
+                with RawVideoEncoder(tmp_batch_mp4, frame_w, frame_h, fps=FPS, codec=cfg["video"]["codec"], bitrate=cfg["ffmpeg"]["bitrate"]) as batch_encoder:
+                    for frame in anaglyphs:
+                        batch_encoder.write(frame)
+                hls_dir = os.path.join(os.path.dirname(cfg["paths"]["final_output"]), "stream")
+                add_batch_to_hls(tmp_batch_mp4, stream_dir=hls_dir, fps=FPS)
+            except Exception as e:
+                print(f"Warning: HLS append failed for anaglyph batch {i}: {e}")
+    except BaseException:
+        if final_encoder is not None:
+            final_encoder.abort()
+        raise
 
-    # Mux original audio to the final video
-    if add_audio:
-        combined_with_audio = combined_out.replace(".mp4", "_audio.mp4")
-        mux_audio_to_video(combined_out, audio_temp, combined_with_audio)
-        os.replace(combined_with_audio, combined_out)
+    if final_encoder is None:
+        raise ValueError("No frames given to encode")
+    # Closing stdin lets ffmpeg finish (and faststart) the final anaglyph video, audio included
+    final_encoder.close()
 
     # Generate HLS assets for streaming under output/stream
     hls_dir = os.path.join(os.path.dirname(combined_out), "stream")
@@ -230,7 +159,7 @@ def main_anaglyph(input_video, add_audio=True):
     # Also generate a dedicated final HLS playlist from the final MP4 for frontend playback
     try:
         final_hls_dir = os.path.join(os.path.dirname(combined_out), "final_hls")
-        add_batch_to_hls(combined_out, stream_dir=final_hls_dir, fps=FPS)
+        add_batch_to_hls(combined_out, stream_dir=final_hls_dir, fps=FPS, mode="vod")
         print(f"✅ Final anaglyph HLS generated at: {final_hls_dir}")
     except Exception as e:
         print(f"Warning: final anaglyph HLS generation failed: {e}")
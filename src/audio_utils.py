@@ -10,5 +10,5 @@ def slice_audio(audio_file, start_sec, duration_sec, out_audio):
     subprocess.run(cmd, check=True)
 
 def mux_audio_to_video(video_file, audio_file, out_file):
-    cmd = ["ffmpeg", "-y", "-i", video_file, "-i", audio_file, "-c:v", "copy", "-c:a", "aac", "-map", "0:v:0", "-map", "1:a:0", out_file]
+    cmd = ["ffmpeg", "-y", "-i", video_file, "-i", audio_file, "-c:v", "copy", "-c:a", "aac", "-map", "0:v:0", "-map", "1:a:0", "-movflags", "+faststart", out_file]
     subprocess.run(cmd, check=True)
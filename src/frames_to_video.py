@@ -1,28 +1,125 @@
 import os
+import functools
 import subprocess
+import numpy as np
 
 # Handle imports for both direct execution and module import
 try:
-    from .utils import ensure_dirs
+    from .utils import ensure_dirs, sorted_entries
 except ImportError:
-    from utils import ensure_dirs
+    from utils import ensure_dirs, sorted_entries
 
-def frames_to_segment(frames_dir, out_segment_path, fps=30, codec="libx264", bitrate="6M"):
+FRAME_EXTS = (".png", ".jpg", ".jpeg")
+
+# Hardware H.264 encoders tried in order when the caller asks for libx264, with their extra args.
+# Set FFMPEG_HWENC=off to always use the software codec.
+HW_H264_ENCODERS = {
+    "h264_nvenc": ["-preset", "p4"],
+    "h264_videotoolbox": [],
+}
+_hw_encoder_failed = False
+
+@functools.lru_cache(maxsize=1)
+def _available_hw_encoder():
+    """First listed hardware encoder that can actually encode a short test clip."""
+    if os.getenv("FFMPEG_HWENC", "auto") == "off":
+        return None
+    try:
+        out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    for name in HW_H264_ENCODERS:
+        if name not in out:
+            continue
+        probe = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.2",
+            "-c:v", name, *HW_H264_ENCODERS[name], "-f", "null", "-",
+        ]
+        if subprocess.run(probe, capture_output=True).returncode == 0:
+            return name
+    return None
+
+def pick_encoder(codec):
+    """(encoder, extra_args) to use for codec: a working hardware H.264 encoder in place of libx264 when available."""
+    hw = _available_hw_encoder() if codec == "libx264" and not _hw_encoder_failed else None
+    return (hw, HW_H264_ENCODERS[hw]) if hw else (codec, [])
+
+def _output_args(encoder, extra, bitrate, faststart, out_segment_path, fps, audio=False):
+    # One keyframe per second, matching the HLS segmenter, so outputs can be segmented by stream copy
+    args = ["-c:v", encoder, *extra, "-pix_fmt", "yuv420p", "-b:v", bitrate, "-g", str(fps)]
+    if audio:
+        # Audio arrives as the second input and is muxed in this same pass
+        args += ["-map", "0:v:0", "-map", "1:a:0", "-c:a", "aac"]
+    if faststart:
+        args += ["-movflags", "+faststart"]
+    args.append(out_segment_path)
+    return args
+
+def _encode(input_args, out_segment_path, codec, bitrate, faststart, fps, audio_path=None):
+    """Run ffmpeg on input_args, preferring a hardware H.264 encoder over libx264.
+    A listed encoder may still lack a usable device, so a failed hardware run is retried
+    once in software and hardware encoding is skipped for the rest of the process."""
+    global _hw_encoder_failed
+    if audio_path:
+        input_args = [*input_args, "-i", audio_path]
+    candidates = [pick_encoder(codec)]
+    if candidates[0][0] != codec:
+        candidates.append((codec, []))
+
+    for i, (encoder, extra) in enumerate(candidates):
+        cmd = ["ffmpeg", "-y", *input_args, *_output_args(encoder, extra, bitrate, faststart, out_segment_path, fps, audio=bool(audio_path))]
+        try:
+            subprocess.run(cmd, check=True)
+            return
+        except subprocess.CalledProcessError as e:
+            if i + 1 < len(candidates):
+                print(f"Warning: {encoder} failed ({e}); falling back to {codec}")
+                _hw_encoder_failed = True
+                continue
+            print(f"Error running ffmpeg command: {e}")
+            print(f"Command was: {' '.join(cmd)}")
+            raise
+
+def frames_to_segment(frames_dir, out_segment_path, fps=30, codec="libx264", bitrate="6M", faststart=False, audio_path=None):
     """
     Use ffmpeg to convert frames (sorted alphabetically) to a mp4 segment with consistent settings.
     This makes it easy to later concat with -c copy.
+    faststart moves the moov atom to the front so browsers can start playback immediately.
+    audio_path, if given, is muxed in the same pass (no separate remux of the video).
     """
     ensure_dirs(os.path.dirname(out_segment_path))
-    
-    # Convert paths to absolute and normalize them
     frames_dir = os.path.abspath(frames_dir)
     out_segment_path = os.path.abspath(out_segment_path)
     
-    # Get list of all PNG files in the directory
-    png_files = sorted([f for f in os.listdir(frames_dir) if f.lower().endswith('.png')])
+    # Get list of all frame images (PNG or JPEG) in the directory
+    entries = sorted_entries(frames_dir, FRAME_EXTS)
+    image_files = [e.name for e in entries]
+    
+    if not image_files:
+        raise ValueError(f"No frame images found in {frames_dir}")
+    
+    # The pipeline names frames frame_000000.<ext> upwards; read those with the image2
+    # pattern demuxer and skip the concat list entirely
+    ext = os.path.splitext(image_files[0])[1]
+    if image_files == [f"frame_{i:06d}{ext}" for i in range(len(image_files))]:
+        input_args = ["-framerate", str(fps), "-start_number", "0", "-i", os.path.join(frames_dir, f"frame_%06d{ext}")]
+        _encode(input_args, out_segment_path, codec, bitrate, faststart, fps, audio_path)
+        return
     
-    if not png_files:
-        raise ValueError(f"No PNG files found in {frames_dir}")
+    frame_paths = [e.path for e in entries]
+    frame_paths_to_segment(frame_paths, out_segment_path, fps=fps, codec=codec, bitrate=bitrate, faststart=faststart, audio_path=audio_path)
+
+def frame_paths_to_segment(frame_paths, out_segment_path, fps=30, codec="libx264", bitrate="6M", faststart=False, audio_path=None):
+    """
+    Encode an explicit, already ordered list of frame images (possibly spread over
+    several folders) into one mp4, so callers need not gather them into one folder first.
+    """
+    if not frame_paths:
+        raise ValueError("No frames given to encode")
+
+    ensure_dirs(os.path.dirname(out_segment_path))
+    out_segment_path = os.path.abspath(out_segment_path)
     
     # Create a temporary text file with the list of files
     temp_dir = os.path.dirname(out_segment_path)
@@ -30,29 +127,15 @@ def frames_to_segment(frames_dir, out_segment_path, fps=30, codec="libx264", bit
     
     # Write file list with proper path formatting for Windows
     with open(file_list, 'w', encoding='utf-8') as f:
-        for png in png_files:
+        for path in frame_paths:
             # Use forward slashes and double backslashes for Windows paths
-            file_path = os.path.join(frames_dir, png).replace('\\', '\\\\')
+            file_path = os.path.abspath(path).replace('\\', '\\\\')
             f.write(f"file '{file_path}'\n")
     
     try:
         # Use concat demuxer with the file list
-        cmd = [
-            "ffmpeg", "-y",
-            "-f", "concat",
-            "-safe", "0",
-            "-r", str(fps),
-            "-i", file_list,
-            "-c:v", codec,
-            "-pix_fmt", "yuv420p",
-            "-b:v", bitrate,
-            out_segment_path
-        ]
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running ffmpeg command: {e}")
-        print(f"Command was: {' '.join(cmd)}")
-        raise
+        input_args = ["-f", "concat", "-safe", "0", "-r", str(fps), "-i", file_list]
+        _encode(input_args, out_segment_path, codec, bitrate, faststart, fps, audio_path)
     finally:
         # Clean up the temporary file
         if os.path.exists(file_list):
@@ -61,6 +144,52 @@ def frames_to_segment(frames_dir, out_segment_path, fps=30, codec="libx264", bit
             except Exception as e:
                 print(f"Warning: Could not remove temporary file {file_list}: {e}")
 
+class RawVideoEncoder:
+    """
+    Encode BGR ndarrays fed one at a time through ffmpeg's stdin (-f rawvideo), so frames
+    that only exist to be encoded never go through an image file.
+    Use as a context manager, or call close() to finalise the file.
+    audio_path, if given, is muxed into the output by the same ffmpeg process.
+    """
+    def __init__(self, out_path, width, height, fps=30, codec="libx264", bitrate="6M", faststart=False, audio_path=None):
+        ensure_dirs(os.path.dirname(out_path))
+        self.out_path = os.path.abspath(out_path)
+        self.frame_shape = (height, width, 3)
+        encoder, extra = pick_encoder(codec)
+        self.cmd = [
+            "ffmpeg", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            *(["-i", audio_path] if audio_path else []),
+            *_output_args(encoder, extra, bitrate, faststart, self.out_path, fps, audio=bool(audio_path)),
+        ]
+        self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match encoder {self.frame_shape}")
+        self.proc.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+
+    def close(self):
+        self.proc.stdin.close()
+        ret = self.proc.wait()
+        if ret != 0:
+            print(f"Command was: {' '.join(self.cmd)}")
+            raise subprocess.CalledProcessError(ret, self.cmd)
+
+    def abort(self):
+        self.proc.kill()
+        self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
 def concat_segments(segment_paths, out_path):
     """
     Concatenate segments using ffmpeg concat demuxer (no re-encode).
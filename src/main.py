@@ -1,13 +1,13 @@
 import os
 import time
-from .utils import load_config, ensure_dirs
-from .video_reader import read_and_write_batches, extract_audio
+from .utils import load_config, ensure_dirs, sorted_entries
+from .video_reader import read_batches, extract_audio
 from .midas_depth import Midas, ModelType
-from .stereo import batch_generate_stereo
+from .stereo import generate_stereo_batch, write_stereo_batch
 from .projection import batch_project
 from .stitch import batch_stack
-from .frames_to_video import frames_to_segment
-from .audio_utils import extract_audio, slice_audio, mux_audio_to_video
+from .frames_to_video import frames_to_segment, frame_paths_to_segment
+from .audio_utils import extract_audio, slice_audio
 from .metadata_inject import inject_vr180_metadata
 from .streaming import add_batch_to_hls
 
@@ -17,15 +17,26 @@ cfg = load_config()
 BATCH_SIZE = cfg["video"]["batch_size"]
 FPS = cfg["video"]["output_fps"]
 SEG_DIR = cfg["paths"]["segments_dir"]
+# Extension for frames passed between stages (the stacked frames are fed to ffmpeg, so png or jpg)
+FRAME_EXT = "." + cfg["video"].get("intermediate_format", "jpg")
 TMP = cfg["paths"]["tmp_dir"]
 ensure_dirs(TMP, SEG_DIR)
 
+def _fast_copy(src, dst):
+    # Hardlink shares the data blocks (no bytes written); fall back to a real copy across filesystems
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
 def process_batch(batch_tuple, midas_obj, cfg):
+    # frames are decoded BGR ndarrays; only the stereo views are written, for the file-based projection step
     batch_idx, start_frame, end_frame, frames = batch_tuple
     print(f"> Processing batch {batch_idx} frames {start_frame}-{end_frame} ({len(frames)})")
     # output folder structure for this batch
     batch_prefix = f"batch_{batch_idx:03d}"
-    depth_out = os.path.join(cfg["paths"]["depth_dir"], batch_prefix)
     left_out = os.path.join(cfg["paths"]["left_dir"], batch_prefix)
     right_out = os.path.join(cfg["paths"]["right_dir"], batch_prefix)
     vr_left = os.path.join(cfg["paths"]["vr_left"], batch_prefix)
@@ -34,31 +45,32 @@ def process_batch(batch_tuple, midas_obj, cfg):
     frames_combined = os.path.join(TMP, batch_prefix, "frames")
     os.makedirs(frames_combined, exist_ok=True)
 
-    # 1) Depth
-    midas_obj.predict_batch(frames, depth_out)
+    # 1) Depth (in memory)
+    depth_maps = midas_obj.predict_frames(frames)
 
     # 2) Stereo
-    depth_map_dict = {os.path.basename(p): os.path.join(depth_out, os.path.basename(p)) for p in frames}
-    batch_generate_stereo(frames, depth_map_dict, left_out, right_out, max_shift=cfg["processing"]["max_shift"])
+    left_stack, right_stack = generate_stereo_batch(frames, depth_maps, max_shift=cfg["processing"]["max_shift"], inpaint=cfg["processing"].get("inpaint", False))
+    names = [f"frame_{start_frame + i:06d}{FRAME_EXT}" for i in range(len(frames))]
+    stereo_pairs = write_stereo_batch(left_stack, right_stack, names, left_out, right_out)
 
-    # 3) Projection: left & right -> vr
-    batch_project(left_out, vr_left, output_width=2048, field_of_view=cfg["processing"]["field_of_view"])
-    batch_project(right_out, vr_right, output_width=2048, field_of_view=cfg["processing"]["field_of_view"])
+    # 3) Projection: left & right -> vr (names come from the stereo step, no re-listing)
+    left_files = [os.path.basename(l) for l, _ in stereo_pairs]
+    right_files = [os.path.basename(r) for _, r in stereo_pairs]
+    batch_project(left_out, vr_left, output_width=2048, field_of_view=cfg["processing"]["field_of_view"], files=left_files)
+    batch_project(right_out, vr_right, output_width=2048, field_of_view=cfg["processing"]["field_of_view"], files=right_files)
 
     # 4) Stack side-by-side into stereo frames
     batch_stack(vr_left, vr_right, stereo_out, side_by_side=True)
 
-    # 5) Copy stereo frames to frames_combined (ensure zeros-based ordering)
-    stereo_files = sorted([f for f in os.listdir(stereo_out) if f.lower().endswith(".png")])
-    for i, f in enumerate(stereo_files):
-        src = os.path.join(stereo_out, f)
-        dst = os.path.join(frames_combined, f"frame_{i:06d}.png")
-        shutil.copy(src, dst)
+    # 5) Link stereo frames into frames_combined (ensure zeros-based ordering)
+    for i, entry in enumerate(sorted_entries(stereo_out, FRAME_EXT)):
+        dst = os.path.join(frames_combined, f"frame_{i:06d}{FRAME_EXT}")
+        _fast_copy(entry.path, dst)
 
     # 6) Return frames folder for this batch (final video will be built from all frames)
     return frames_combined, (start_frame, end_frame)
 
-def main(input_video, add_audio=True):
+def main(input_video, add_audio=True, preview_fps=None):
     print("Reading video and splitting into batches...")
     # Cleanup previous run's artifacts to avoid appending across runs
     try:
@@ -78,10 +90,9 @@ def main(input_video, add_audio=True):
         os.makedirs(os.path.join(out_root, "final_hls"), exist_ok=True)
     except Exception as e:
         print(f"Warning: failed to reset output/tmp dirs: {e}")
-    frames_dir = cfg["paths"]["frames_dir"]
-    ensure_dirs(frames_dir)
-    batches, fps, total_frames, w, h = read_and_write_batches(input_video, frames_dir, batch_size=BATCH_SIZE)
-    print(f"Total frames: {total_frames}, FPS detected: {fps}, total batches: {len(batches)}")
+    # Source frames stay in memory through depth and stereo; no PNG dump of the input
+    batches, fps, total_frames, w, h = read_batches(input_video, batch_size=BATCH_SIZE, sample_fps=preview_fps)
+    print(f"Total frames: {total_frames}, FPS detected: {fps}, batch size: {BATCH_SIZE}")
 
     # prepare midas
     midas = Midas(ModelType[cfg["processing"]["midas_model"] if cfg["processing"]["midas_model"] in ModelType.__members__ else "MIDAS_SMALL"])
@@ -92,22 +103,13 @@ def main(input_video, add_audio=True):
     if add_audio:
         extract_audio(input_video, audio_temp)
 
-    # Accumulate all frames from batches into one ordered folder
-    all_frames_dir = os.path.join(TMP, "all_frames")
-    if os.path.exists(all_frames_dir):
-        shutil.rmtree(all_frames_dir)
-    os.makedirs(all_frames_dir, exist_ok=True)
+    # Track every batch's frames in order; the final encode reads them in place
+    all_frame_paths = []
 
-    next_index = 0
     for i, batch in enumerate(batches):
         frames_dir_batch, (sframe, eframe) = process_batch(batch, midas, cfg)
-        batch_files = sorted([f for f in os.listdir(frames_dir_batch) if f.lower().endswith(".png")])
-        for f in batch_files:
-            src = os.path.join(frames_dir_batch, f)
-            dst = os.path.join(all_frames_dir, f"frame_{next_index:06d}.png")
-            shutil.copy(src, dst)
-            next_index += 1
-        print(f"Batch {sframe}-{eframe} appended. Total frames so far: {next_index}")
+        all_frame_paths.extend(e.path for e in sorted_entries(frames_dir_batch, FRAME_EXT))
+        print(f"Batch {sframe}-{eframe} appended. Total frames so far: {len(all_frame_paths)}")
 
         # Update HLS after each batch by rendering a small MP4 for this batch and appending to HLS
         try:
@@ -120,13 +122,11 @@ def main(input_video, add_audio=True):
 
     # Render single final video from all frames
     combined_out = cfg["paths"]["final_output"]
-    frames_to_segment(all_frames_dir, combined_out, fps=FPS, codec=cfg["video"]["codec"], bitrate=cfg["ffmpeg"]["bitrate"])
-
-    # Mux original full audio to the final video
-    if add_audio:
-        combined_with_audio = combined_out.replace(".mp4", "_audio.mp4")
-        mux_audio_to_video(combined_out, audio_temp, combined_with_audio)
-        os.replace(combined_with_audio, combined_out)
+    # Original full audio is muxed by the same ffmpeg pass that encodes the frames
+    frame_paths_to_segment(
+        all_frame_paths, combined_out, fps=FPS, codec=cfg["video"]["codec"], bitrate=cfg["ffmpeg"]["bitrate"],
+        faststart=True, audio_path=audio_temp if add_audio else None,
+    )
 
     # Generate HLS assets for streaming under output/stream
     hls_dir = os.path.join(os.path.dirname(combined_out), "stream")
@@ -140,7 +140,7 @@ def main(input_video, add_audio=True):
     # Also generate a dedicated final HLS playlist from the final MP4 for frontend playback
     try:
         final_hls_dir = os.path.join(os.path.dirname(combined_out), "final_hls")
-        add_batch_to_hls(final_with_meta, stream_dir=final_hls_dir, fps=FPS)
+        add_batch_to_hls(final_with_meta, stream_dir=final_hls_dir, fps=FPS, mode="vod")
         print(f"✅ Final HLS generated at: {final_hls_dir}")
     except Exception as e:
         print(f"Warning: final HLS generation failed: {e}")
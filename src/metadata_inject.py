@@ -6,6 +6,7 @@ def inject_vr180_metadata(input_file, output_file):
         "-c", "copy",
         "-metadata:s:v:0", "stereo_mode=left_right",
         "-metadata:s:v:0", "projection=180",
+        "-movflags", "+faststart",
         output_file
     ]
     subprocess.run(cmd, check=True)
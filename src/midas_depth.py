@@ -4,6 +4,9 @@ import numpy as np
 import os
 from enum import Enum
 
+# Frames per forward pass; bounds GPU memory for the full-resolution interpolate
+MIDAS_BATCH_SIZE = int(os.getenv("MIDAS_BATCH_SIZE", 8))
+
 class ModelType(Enum):
     DPT_LARGE = "DPT_Large"
     DPT_Hybrid = "DPT_Hybrid"
@@ -16,34 +19,62 @@ class Midas:
         self.device = device or (torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu"))
         self.midas.to(self.device)
         self.midas.eval()
+        # Reduced precision: fp16 weights/activations on CUDA; on CPU, MIDAS_QUANTIZE=1 opts into dynamic
+        # int8 Linear layers (only the DPT models spend their time there, and it changes the depth output)
+        self._dtype = torch.float32
+        if self.device.type == "cuda":
+            self.midas = self.midas.half()
+            self._dtype = torch.float16
+        elif os.getenv("MIDAS_QUANTIZE", "0") == "1":
+            self.midas = torch.quantization.quantize_dynamic(self.midas, {torch.nn.Linear}, dtype=torch.qint8)
         midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms")
         if self.modelType.value in ["DPT_Large", "DPT_Hybrid"]:
             self.transform = midas_transforms.dpt_transform
         else:
             self.transform = midas_transforms.small_transform
 
+    def _depth_to_gray8(self, prediction, size):
+        """Upsample raw (N, h, w) predictions to size and min-max scale each to 0..255,
+        all on the device; returns a (N, H, W) uint8 tensor."""
+        prediction = torch.nn.functional.interpolate(
+            prediction.float().unsqueeze(1),
+            size=size,
+            mode="bicubic",
+            align_corners=False,
+        )
+        lo = prediction.amin(dim=(2, 3), keepdim=True)
+        hi = prediction.amax(dim=(2, 3), keepdim=True)
+        depth = ((prediction - lo) / (hi - lo).clamp_min(1e-6) * 255).round().to(torch.uint8)
+        return depth.squeeze(1)
+
     def predict_frame(self, frame):
-        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        inp = self.transform(img).to(self.device)
-        with torch.no_grad():
-            prediction = self.midas(inp)
-            prediction = torch.nn.functional.interpolate(
-                prediction.unsqueeze(1),
-                size=img.shape[:2],
-                mode="bicubic",
-                align_corners=False,
-            ).squeeze()
-        depthMap = prediction.cpu().numpy()
-        depthMap = cv2.normalize(depthMap, None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8U)
-        depthMap = cv2.cvtColor(depthMap, cv2.COLOR_GRAY2BGR)
-        return depthMap
+        """BGR depth image for one frame; the gray -> BGR expansion happens on the host."""
+        return cv2.cvtColor(self.predict_frames([frame])[0], cv2.COLOR_GRAY2BGR)
+
+    def predict_frames(self, frames):
+        """Depth maps for already decoded same-size frames, kept in memory (no PNG round trip).
+        Frames go through the network MIDAS_BATCH_SIZE at a time; upsampling and normalisation
+        run on the device, with one host copy per chunk straight into the result.
+        Returns single-channel (N, H, W) uint8 depth maps.
+        """
+        if not len(frames):
+            return np.empty((0, 0, 0), dtype=np.uint8)
+        results = np.empty((len(frames), *frames[0].shape[:2]), dtype=np.uint8)
+        for i in range(0, len(frames), MIDAS_BATCH_SIZE):
+            chunk = frames[i:i + MIDAS_BATCH_SIZE]
+            # MiDaS transforms yield (1, 3, h, w); concatenate into one (N, 3, h, w) batch
+            inp = torch.cat([self.transform(cv2.cvtColor(f, cv2.COLOR_BGR2RGB)) for f in chunk])
+            inp = inp.to(self.device, dtype=self._dtype)
+            with torch.no_grad():
+                depth = self._depth_to_gray8(self.midas(inp), chunk[0].shape[:2])
+            torch.from_numpy(results[i:i + len(chunk)]).copy_(depth)
+        return results
 
     def predict_batch(self, frame_paths, out_dir):
         os.makedirs(out_dir, exist_ok=True)
+        frames = [cv2.imread(p) for p in frame_paths]
         results = []
-        for p in frame_paths:
-            frame = cv2.imread(p)
-            d = self.predict_frame(frame)
+        for p, d in zip(frame_paths, self.predict_frames(frames)):
             outp = os.path.join(out_dir, os.path.basename(p))
             cv2.imwrite(outp, d)
             results.append(outp)
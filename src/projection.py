@@ -1,53 +1,126 @@
 import cv2
 import numpy as np
 import os
-from numba import jit, prange
+import functools
+import threading
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from .utils import sorted_files, read_frame, write_frame
+
+# Mapping arrays depend only on the frame size, output width and FOV, so they are
+# reused across batches and eyes, and persisted so later runs skip recomputing them
+MAPPING_CACHE_DIR = os.getenv("MAPPING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "vr180_mappings"))
+
+# OpenCV's T-API runs remap/flip/mask on an OpenCL device when frames are passed as UMat.
+# Set VR180_OPENCL=0 to stay on the CPU path.
+USE_OPENCL = os.getenv("VR180_OPENCL", "1") == "1" and cv2.ocl.haveOpenCL()
+
+PROJECT_WORKERS = int(os.getenv("PROJECT_WORKERS", os.cpu_count() or 1))
 
-@jit(nopython=True, parallel=True)
 def create_mapping_arrays(output_width, output_height, focal, w, h):
-    x_coords = np.zeros((output_height, output_width), dtype=np.float32)
-    y_coords = np.zeros((output_height, output_width), dtype=np.float32)
-    valid_mask = np.zeros((output_height, output_width), dtype=np.bool_)
-    for y_out in prange(output_height):
-        for x_out in prange(output_width):
-            longitude = (x_out / output_width - 0.5) * np.pi
-            latitude = (y_out / output_height - 0.5) * (np.pi / 2)
-            x_dir = np.cos(latitude) * np.sin(longitude)
-            y_dir = np.sin(latitude)
-            z_dir = np.cos(latitude) * np.cos(longitude)
-            if z_dir > 0:
-                x_flat = (x_dir * focal / z_dir) + (w / 2)
-                y_flat = (-y_dir * focal / z_dir) + (h / 2)
-                if 0 <= x_flat < w-1 and 0 <= y_flat < h-1:
-                    x_coords[y_out, x_out] = x_flat
-                    y_coords[y_out, x_out] = y_flat
-                    valid_mask[y_out, x_out] = True
+    """Equirectangular VR180 -> flat source lookup maps, computed with NumPy broadcasting."""
+    longitude = (np.arange(output_width) / output_width - 0.5) * np.pi
+    latitude = (np.arange(output_height) / output_height - 0.5) * (np.pi / 2)
+    lon = longitude[np.newaxis, :]
+    lat = latitude[:, np.newaxis]
+    x_dir = np.cos(lat) * np.sin(lon)
+    y_dir = np.broadcast_to(np.sin(lat), (output_height, output_width))
+    z_dir = np.cos(lat) * np.cos(lon)
+    front = z_dir > 0
+    # Points behind the viewer never validate; keep the division finite there
+    safe_z = np.where(front, z_dir, 1.0)
+    x_flat = (x_dir * focal / safe_z) + (w / 2)
+    y_flat = (-y_dir * focal / safe_z) + (h / 2)
+    valid_mask = front & (0 <= x_flat) & (x_flat < w - 1) & (0 <= y_flat) & (y_flat < h - 1)
+    x_coords = np.where(valid_mask, x_flat, 0).astype(np.float32)
+    y_coords = np.where(valid_mask, y_flat, 0).astype(np.float32)
     return x_coords, y_coords, valid_mask
 
-def flat_to_vr180_spherical_optimized(img, output_width=2048, field_of_view=140, x_coords=None, y_coords=None, valid_mask=None):
-    h, w = img.shape[:2]
-    output_height = output_width // 2
-    if x_coords is None or y_coords is None or valid_mask is None:
+@functools.lru_cache(maxsize=8)
+def cached_mapping(w, h, output_width, field_of_view):
+    """(x_coords, y_coords, valid_mask) for a w x h source, memoized in-process and on disk."""
+    cache_path = os.path.join(MAPPING_CACHE_DIR, f"mapping_{w}x{h}_{field_of_view}_{output_width}.npz")
+    try:
+        with np.load(cache_path) as data:
+            maps = data["x_coords"], data["y_coords"], data["valid_mask"]
+    except (OSError, KeyError, ValueError):
         fov_rad = np.radians(field_of_view)
         focal = (w / 2) / np.tan(fov_rad / 2)
-        x_coords, y_coords, valid_mask = create_mapping_arrays(output_width, output_height, focal, w, h)
-    # remap requires mapping in float32
+        maps = create_mapping_arrays(output_width, output_width // 2, focal, w, h)
+        try:
+            os.makedirs(MAPPING_CACHE_DIR, exist_ok=True)
+            tmp_path = cache_path + f".{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, x_coords=maps[0], y_coords=maps[1], valid_mask=maps[2])
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Warning: could not persist projection mapping to {cache_path}: {e}")
+    # Shared between callers through the lru_cache: treat as read-only
+    return maps
+
+@functools.lru_cache(maxsize=8)
+def fixed_point_mapping(w, h, output_width, field_of_view):
+    """cached_mapping converted once to OpenCV's fixed-point remap maps (CV_16SC2 + CV_16UC1),
+    which take the faster vectorized INTER_LINEAR path, plus the valid mask as uint8."""
+    x_coords, y_coords, valid_mask = cached_mapping(w, h, output_width, field_of_view)
+    map1, map2 = cv2.convertMaps(x_coords, y_coords, cv2.CV_16SC2)
+    return map1, map2, valid_mask.view(np.uint8)
+
+def flat_to_vr180_spherical_optimized(img, output_width=2048, field_of_view=140, x_coords=None, y_coords=None, valid_mask=None):
+    """x_coords/y_coords may be float32 maps or the fixed-point pair from cv2.convertMaps.
+    img and the maps may also be cv2.UMat, in which case the result is a UMat too."""
+    if x_coords is None or y_coords is None or valid_mask is None:
+        h, w = (img.get() if isinstance(img, cv2.UMat) else img).shape[:2]
+        x_coords, y_coords, valid_mask = fixed_point_mapping(w, h, output_width, field_of_view)
     result = cv2.remap(img, x_coords, y_coords, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0,0,0))
-    result[~valid_mask] = 0
-    return result
+    # Zero everything outside the projected area in one masked pass
+    mask = valid_mask.view(np.uint8) if isinstance(valid_mask, np.ndarray) and valid_mask.dtype != np.uint8 else valid_mask
+    return cv2.bitwise_and(result, result, mask=mask)
+
+def make_projector(w, h, output_width=2048, field_of_view=140, flip_vertical=True):
+    """
+    Specialise the projection for one source size / output width / FOV.
+    The maps are bound once, and the vertical flip is baked into them by reversing their
+    rows, so project(img) is a single remap plus mask with no per-frame argument handling.
+    With OpenCL, each calling thread switches the T-API on and uploads its own copy of the maps
+    on first use: OpenCV keeps that switch and the OpenCL queue per thread, so device buffers
+    are not shared between batch_project's workers.
+    """
+    cv2.ocl.setUseOpenCL(USE_OPENCL)
+    maps = fixed_point_mapping(w, h, output_width, field_of_view)
+    if flip_vertical:
+        maps = tuple(np.ascontiguousarray(m[::-1]) for m in maps)
+    device = threading.local()
+
+    def project(img):
+        map1, map2, valid_mask = maps
+        if USE_OPENCL:
+            if not hasattr(device, "maps"):
+                cv2.ocl.setUseOpenCL(True)
+                device.maps = tuple(cv2.UMat(m) for m in maps)
+            # Each frame then stays on the device until imwrite
+            map1, map2, valid_mask = device.maps
+            img = cv2.UMat(img)
+        result = cv2.remap(img, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0,0,0))
+        return cv2.bitwise_and(result, result, mask=valid_mask)
 
-def batch_project(folder_in, folder_out, output_width=2048, field_of_view=140):
+    return project
+
+def batch_project(folder_in, folder_out, output_width=2048, field_of_view=140, files=None):
+    """Project every image in folder_in (or just the given file names) into folder_out."""
     os.makedirs(folder_out, exist_ok=True)
-    files = sorted([f for f in os.listdir(folder_in) if f.lower().endswith((".png", ".jpg", ".jpeg"))])
+    if files is None:
+        files = sorted_files(folder_in)
     if not files:
         return
-    sample = cv2.imread(os.path.join(folder_in, files[0]))
+    sample = read_frame(os.path.join(folder_in, files[0]))
     h, w = sample.shape[:2]
-    fov_rad = np.radians(field_of_view)
-    focal = (w / 2) / np.tan(fov_rad / 2)
-    x_coords, y_coords, valid_mask = create_mapping_arrays(output_width, output_width//2, focal, w, h)
-    for f in files:
-        img = cv2.imread(os.path.join(folder_in, f))
-        vr = flat_to_vr180_spherical_optimized(img, output_width, field_of_view, x_coords, y_coords, valid_mask)
-        vr = cv2.flip(vr, 0)
-        cv2.imwrite(os.path.join(folder_out, f), vr)
+    project = make_projector(w, h, output_width, field_of_view)
+
+    def _project_one(f):
+        img = read_frame(os.path.join(folder_in, f))
+        write_frame(os.path.join(folder_out, f), project(img))
+
+    # imread/remap/imwrite all release the GIL, so threads scale across cores while
+    # sharing the maps directly (no pickling or shared-memory setup as with processes)
+    with ThreadPoolExecutor(max_workers=PROJECT_WORKERS) as pool:
+        list(pool.map(_project_one, files))
@@ -1,45 +1,141 @@
 import cv2
 import numpy as np
 import os
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from .utils import write_frame
 
-def generate_stereo_from_depth_frame(frame, depth, max_shift=30):
+# Frames of a batch are independent; the sort, gather and scatter kernels run in NumPy/OpenCV C code
+STEREO_WORKERS = min(8, os.cpu_count() or 1)
+# cv2.inpaint is single-threaded and releases the GIL, so the left view is inpainted here while the right runs inline
+_INPAINT_POOL = ThreadPoolExecutor(max_workers=2)
+
+@functools.lru_cache(maxsize=4)
+def _pixel_grid(H, W):
+    """Flat row offsets (y*W) and column indices for an HxW frame, built once per frame size."""
+    ys, xs = np.indices((H, W))
+    row_base = ys * W
+    row_base.setflags(write=False)
+    xs.setflags(write=False)
+    return row_base, xs
+
+def _scatter_last(targets, src, out):
+    """
+    Scatter src rows to flat targets of out (zeroed first) so the last source wins on collisions, exactly as a
+    sequential loop would. targets come out of a row-major raster so they are nearly sorted, which keeps the
+    stable sort close to linear.
+    Returns hit, marking the targets that received a pixel (the rest are disocclusion holes).
+    """
+    order = np.argsort(targets, kind="stable")
+    sorted_targets = targets[order]
+    last = np.empty(sorted_targets.shape, dtype=bool)
+    last[:-1] = sorted_targets[1:] != sorted_targets[:-1]
+    last[-1] = True
+    written = sorted_targets[last]
+    out[...] = 0
+    out[written] = src[order[last]]
+    hit = np.zeros(out.shape[0], dtype=bool)
+    hit[written] = True
+    return hit
+
+def _fill_holes(eye, valid):
+    """
+    Fill pixels where valid is False from the nearest valid pixel to their left on the same row (to their right for
+    holes touching the left border). Disparity holes are thin horizontal gaps, so this 1-D fill looks
+    close to cv2.inpaint at a fraction of the cost.
+    Fills eye in place: only hole pixels are written and they are only read from valid pixels.
+    """
+    hy, hx = np.nonzero(~valid)
+    if hy.size == 0:
+        return eye
+    W = eye.shape[1]
+    cols = np.arange(W)
+    from_left = np.maximum.accumulate(np.where(valid, cols, 0), axis=1)[hy, hx]
+    from_right = np.minimum.accumulate(np.where(valid, cols, W - 1)[:, ::-1], axis=1)[:, ::-1][hy, hx]
+    eye[hy, hx] = eye[hy, np.where(valid[hy, from_left], from_left, from_right)]
+    return eye
+
+@functools.lru_cache(maxsize=8)
+def _shift_lut(max_shift):
+    """Shift for each uint8 depth value, from the same float formula as the non-uint8 path."""
+    levels = np.arange(256, dtype=np.float32)
+    lut = ((1 - levels / 255.0) * max_shift).astype(np.int32)
+    lut = lut.astype(np.int16) if abs(max_shift) < 2 ** 15 else lut
+    lut.setflags(write=False)
+    return lut
+
+def generate_stereo_from_depth_frame(frame, depth, max_shift=30, inpaint=False, out=None):
+    """inpaint=True uses cv2 Telea inpainting for the disocclusion holes instead of the scanline fill.
+    out=(left, right) gives C-contiguous (H, W, 3) arrays to write the views into instead of allocating them.
+    """
     H, W = frame.shape[:2]
     if depth is None:
-        depth = np.ones((H, W), dtype=np.float32)
+        shift = np.zeros((H, W), dtype=np.int16)
     else:
         if depth.ndim == 3:
             depth = cv2.cvtColor(depth, cv2.COLOR_BGR2GRAY)
-        depth = depth.astype(np.float32) / 255.0
-
-    shift = (1 - depth) * max_shift
-    left_eye = np.zeros_like(frame)
-    right_eye = np.zeros_like(frame)
-
-    # faster raster approach
-    xs = np.arange(W)
-    for y in range(H):
-        dx_row = shift[y].astype(np.int32)
-        for x in range(W):
-            dx = dx_row[x]
-            nl = min(W-1, x + dx)
-            nr = max(0, x - dx)
-            left_eye[y, nl] = frame[y, x]
-            right_eye[y, nr] = frame[y, x]
-
-    mask_left = (left_eye.sum(axis=2) == 0).astype(np.uint8)
-    left_eye = cv2.inpaint(left_eye, mask_left, 3, cv2.INPAINT_TELEA)
-    mask_right = (right_eye.sum(axis=2) == 0).astype(np.uint8)
-    right_eye = cv2.inpaint(right_eye, mask_right, 3, cv2.INPAINT_TELEA)
+        if depth.dtype == np.uint8:
+            # One table lookup per pixel instead of a float32 depth plane
+            shift = _shift_lut(max_shift)[depth]
+        else:
+            shift = ((1 - depth.astype(np.float32) / 255.0) * max_shift).astype(np.int32)
+
+    # Vectorized scatter: every pixel goes to its shifted column in one pass per eye.
+    # Where several sources land on the same target pixel the rightmost source in row order wins,
+    # the same overwrite order as a per-pixel loop.
+    C = frame.shape[2]
+    row_base, xs = _pixel_grid(H, W)
+    nl = np.minimum(W - 1, xs + shift)
+    nr = np.maximum(0, xs - shift)
+    src = np.ascontiguousarray(frame).reshape(-1, C)
+    if out is None:
+        left_eye, right_eye = np.empty_like(src).reshape(H, W, C), np.empty_like(src).reshape(H, W, C)
+    else:
+        left_eye, right_eye = out
+        if not (left_eye.flags.c_contiguous and right_eye.flags.c_contiguous):
+            raise ValueError("out arrays must be C-contiguous")
+    # reshape of a C-contiguous array is a view, so the scatter writes straight into the eyes
+    hit_left = _scatter_last((row_base + nl).ravel(), src, left_eye.reshape(-1, C)).reshape(H, W)
+    hit_right = _scatter_last((row_base + nr).ravel(), src, right_eye.reshape(-1, C)).reshape(H, W)
+
+    # Holes are the pixels the scatter never wrote, tracked directly instead of re-scanning for all-zero pixels
+    if not inpaint:
+        return _fill_holes(left_eye, hit_left), _fill_holes(right_eye, hit_right)
+
+    mask_left = (~hit_left).view(np.uint8)
+    fut_left = _INPAINT_POOL.submit(cv2.inpaint, left_eye, mask_left, 3, cv2.INPAINT_TELEA)
+    mask_right = (~hit_right).view(np.uint8)
+    right_eye[...] = cv2.inpaint(right_eye, mask_right, 3, cv2.INPAINT_TELEA)
+    left_eye[...] = fut_left.result()
     return left_eye, right_eye
 
-def batch_generate_stereo(frame_paths, depth_paths, left_out_dir, right_out_dir, max_shift=20):
+def generate_stereo_batch(frames, depths, max_shift=20, inpaint=False):
+    """Generate stereo views for a batch of frames.
+    frames and depths are aligned sequences (depths single-channel, e.g. the (N, H, W) stack from predict_frames); returns (B, H, W, 3) left and right stacks.
+    The output stacks are allocated once and each frame's views are written straight into its slots,
+    and all frames share the same pixel index grid. Frames are spread over STEREO_WORKERS threads,
+    which share the stacks without pickling anything.
+    """
+    lefts = np.empty((len(frames), *frames[0].shape), dtype=frames[0].dtype)
+    rights = np.empty_like(lefts)
+
+    def _one(i):
+        generate_stereo_from_depth_frame(frames[i], depths[i], max_shift=max_shift, inpaint=inpaint, out=(lefts[i], rights[i]))
+
+    with ThreadPoolExecutor(max_workers=min(STEREO_WORKERS, len(frames))) as pool:
+        list(pool.map(_one, range(len(frames))))
+    return lefts, rights
+
+def write_stereo_batch(left_views, right_views, names, left_out_dir, right_out_dir):
+    """Write in-memory left/right views under the given file names (the extension picks the format, see write_frame);
+    returns [(left_path, right_path), ...]."""
     os.makedirs(left_out_dir, exist_ok=True)
     os.makedirs(right_out_dir, exist_ok=True)
-    for fpath in frame_paths:
-        fname = os.path.basename(fpath)
-        frame = cv2.imread(fpath)
-        dpath = depth_paths.get(fname)
-        depth = cv2.imread(dpath, cv2.IMREAD_GRAYSCALE) if dpath and os.path.exists(dpath) else None
-        l, r = generate_stereo_from_depth_frame(frame, depth, max_shift=max_shift)
-        cv2.imwrite(os.path.join(left_out_dir, fname), l)
-        cv2.imwrite(os.path.join(right_out_dir, fname), r)
+    written = []
+    for l, r, fname in zip(left_views, right_views, names):
+        left_path = os.path.join(left_out_dir, fname)
+        right_path = os.path.join(right_out_dir, fname)
+        write_frame(left_path, l)
+        write_frame(right_path, r)
+        written.append((left_path, right_path))
+    return written
@@ -1,21 +1,57 @@
-import cv2
 import os
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from .utils import sorted_files, read_frame, write_frame, encode_frame
 
-def stack_lr(left_path, right_path, out_path, side_by_side=True):
-    l = cv2.imread(left_path)
-    r = cv2.imread(right_path)
+STACK_WORKERS = min(8, os.cpu_count() or 1)
+# Encoded frames are handed to these threads for the file write, overlapping disk I/O with the next frame
+_WRITER = ThreadPoolExecutor(max_workers=2)
+# One output canvas per thread and frame layout, reused for every frame instead of np.hstack allocating
+_CANVAS_CACHE = threading.local()
+
+def _canvas(shape, dtype, side_by_side):
+    H, W, C = shape
+    key = (H, W, C, dtype, side_by_side)
+    cache = _CANVAS_CACHE.__dict__
+    if key not in cache:
+        cache[key] = np.empty((H, 2 * W, C) if side_by_side else (2 * H, W, C), dtype=dtype)
+    return cache[key]
+
+def stack_lr(left_path, right_path, out_path, side_by_side=True, async_write=False):
+    """Stack a stereo pair into out_path. With async_write the frame is encoded here and the write is
+    queued on the writer threads; the returned future must be waited on before reading out_path."""
+    l = read_frame(left_path)
+    r = read_frame(right_path)
     if l.shape != r.shape:
         raise ValueError("Left and right shapes differ")
+    H, W = l.shape[:2]
+    out = _canvas(l.shape, l.dtype, side_by_side)
     if side_by_side:
-        out = np.hstack((l, r))
+        out[:, :W] = l
+        out[:, W:] = r
     else:
-        out = np.vstack((l, r))
-    cv2.imwrite(out_path, out)
+        out[:H] = l
+        out[H:] = r
+    if async_write:
+        # Encoding copies the canvas into bytes, so it can be reused right away
+        data = encode_frame(out_path, out)
+        return _WRITER.submit(Path(out_path).write_bytes, data)
+    write_frame(out_path, out)
 
 def batch_stack(left_dir, right_dir, out_dir, side_by_side=True):
     os.makedirs(out_dir, exist_ok=True)
-    left_files = sorted([f for f in os.listdir(left_dir) if f.endswith(".png")])
-    right_files = sorted([f for f in os.listdir(right_dir) if f.endswith(".png")])
-    for lf, rf in zip(left_files, right_files):
-        stack_lr(os.path.join(left_dir, lf), os.path.join(right_dir, rf), os.path.join(out_dir, lf), side_by_side)
+    left_files = sorted_files(left_dir)
+    right_files = sorted_files(right_dir)
+
+    def _stack_one(pair):
+        lf, rf = pair
+        return stack_lr(os.path.join(left_dir, lf), os.path.join(right_dir, rf), os.path.join(out_dir, lf), side_by_side, async_write=True)
+
+    # Stacking is decode + memcpy + encode, all GIL-releasing in cv2, so threads scale without pickling frames
+    with ThreadPoolExecutor(max_workers=STACK_WORKERS) as pool:
+        writes = list(pool.map(_stack_one, zip(left_files, right_files)))
+    # Every frame must be on disk before the caller lists out_dir
+    for fut in writes:
+        fut.result()
@@ -1,42 +1,131 @@
 import os, re, subprocess
 
-def _next_segment_start_number(stream_dir: str) -> int:
-    pattern = re.compile(r"segment_(\d{5})\.ts$")
+try:
+    from .frames_to_video import pick_encoder
+except ImportError:
+    from frames_to_video import pick_encoder
+
+# Per-encoder rate control for HLS re-encodes; the hardware encoder is auto-detected (see frames_to_video)
+HLS_ENCODER_ARGS = {
+    "h264_nvenc": ["-preset", "p4", "-tune", "ll", "-rc", "cbr", "-b:v", "4M"],
+    "h264_videotoolbox": ["-b:v", "4M"],
+}
+# libx264 per mode: live appends favour latency (no B-frames), VOD favours size and seeking (capped CRF, bufsize = 2x maxrate)
+X264_HLS_ARGS = {
+    "live": ["-preset", "veryfast", "-tune", "zerolatency", "-bf", "0"],
+    "vod": ["-preset", "faster", "-crf", "23", "-bf", "3", "-maxrate", "6M", "-bufsize", "12M"],
+}
+# (segment length in seconds, playlist type, hls_flags) per mode
+HLS_MODES = {
+    "live": ("2", "event", "independent_segments+append_list+temp_file"),
+    "vod": ("6", "vod", "independent_segments+temp_file"),
+}
+
+# Next free segment index per stream dir, so appends don't rescan the directory every batch.
+# Mirrored to COUNTER_FILE inside the dir; a missing file means the dir was reset and is rescanned.
+_SEG_COUNTERS: dict = {}
+COUNTER_FILE = ".next_idx"
+
+_SEG_RE = re.compile(r"segment_(\d{5})\.ts$")
+
+def _segment_index(name: str):
+    # Fast path for the fixed-width names we write; the regex only sees odd names
+    if len(name) == 16 and name.startswith("segment_") and name.endswith(".ts") and name[8:13].isdigit():
+        return int(name[8:13])
+    m = _SEG_RE.match(name)
+    return int(m.group(1)) if m else None
+
+def _scan_segment_start_number(stream_dir: str) -> int:
     max_idx = -1
     if os.path.isdir(stream_dir):
-        for name in os.listdir(stream_dir):
-            m = pattern.match(name)
-            if m:
-                try:
-                    idx = int(m.group(1))
-                    if idx > max_idx:
-                        max_idx = idx
-                except ValueError:
-                    continue
+        with os.scandir(stream_dir) as it:
+            for entry in it:
+                idx = _segment_index(entry.name)
+                if idx is not None and idx > max_idx:
+                    max_idx = idx
     return (max_idx + 1) if max_idx >= 0 else 0
 
-def add_batch_to_hls(batch_file, stream_dir="stream", fps=30):
+def _next_segment_start_number(stream_dir: str) -> int:
+    key = os.path.abspath(stream_dir)
+    counter_path = os.path.join(stream_dir, COUNTER_FILE)
+    idx = _SEG_COUNTERS.get(key) if os.path.exists(counter_path) else None
+    if idx is None:
+        try:
+            with open(counter_path) as f:
+                idx = int(f.read())
+        except (OSError, ValueError):
+            idx = _scan_segment_start_number(stream_dir)
+    # Step past the segments the previous append wrote (a few stats, not a full listing)
+    while os.path.exists(os.path.join(stream_dir, f"segment_{idx:05d}.ts")):
+        idx += 1
+    _SEG_COUNTERS[key] = idx
+    tmp_path = counter_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(idx))
+    os.replace(tmp_path, counter_path)
+    return idx
+
+def _is_h264_yuv420p(path: str) -> bool:
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,pix_fmt", "-of", "csv=p=0", path,
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return out == "h264,yuv420p"
+
+def _hls_video_args(encoder, fps, mode):
+    rate_args = X264_HLS_ARGS[mode] if encoder == "libx264" else HLS_ENCODER_ARGS[encoder]
+    return [
+        "-c:v", encoder, *rate_args, "-profile:v", "high", "-pix_fmt", "yuv420p",
+        "-r", str(fps), "-g", str(fps), "-keyint_min", str(fps), "-sc_threshold", "0",
+    ]
+
+def add_batch_to_hls(batch_file, stream_dir="stream", fps=30, copy_video=None, mode="live"):
+    """
+    copy_video=None probes the input: H.264/yuv420p video (what this pipeline encodes, with a
+    keyframe every fps frames) is segmented by stream copy instead of being re-encoded.
+    Re-encodes use a hardware H.264 encoder when one is available, falling back to libx264.
+    mode="live" appends 2s segments to an event playlist; mode="vod" writes 6s segments and a
+    closed VOD playlist, for one-shot playlists of a finished video.
+    """
+    hls_time, playlist_type, hls_flags = HLS_MODES[mode]
     os.makedirs(stream_dir, exist_ok=True)
+    if copy_video is None:
+        copy_video = _is_h264_yuv420p(batch_file)
 
     # Append batch as .ts segment into HLS with audio and keyframe-aligned segments
     # Use zero-padded segment numbering for stable paths
     start_number = _next_segment_start_number(stream_dir)
     seg_template = os.path.join(stream_dir, "segment_%05d.ts").replace('\\', '/')
     playlist_path = os.path.join(stream_dir, "output.m3u8").replace('\\', '/')
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", batch_file,
-        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "high", "-pix_fmt", "yuv420p",
-        "-r", str(fps), "-g", str(fps), "-keyint_min", str(fps), "-sc_threshold", "0",
+    hls_args = [
         "-c:a", "aac", "-b:a", "128k", "-ar", "48000", "-ac", "2",
-        "-hls_time", "2", "-hls_list_size", "0",
-        "-hls_flags", "independent_segments+append_list+temp_file",
-        "-hls_playlist_type", "event",
+        "-hls_time", hls_time, "-hls_list_size", "0",
+        "-hls_flags", hls_flags,
+        "-hls_playlist_type", playlist_type,
         "-start_number", str(start_number),
         "-hls_segment_filename", seg_template,
         "-f", "hls", playlist_path
     ]
-    subprocess.run(cmd, check=True)
+    if copy_video:
+        video_variants = [["-c:v", "copy"]]
+    else:
+        encoder = pick_encoder("libx264")[0]
+        video_variants = [_hls_video_args(encoder, fps, mode)]
+        if encoder != "libx264":
+            video_variants.append(_hls_video_args("libx264", fps, mode))
+    for i, video_args in enumerate(video_variants):
+        cmd = ["ffmpeg", "-y", "-i", batch_file, *video_args, *hls_args]
+        try:
+            subprocess.run(cmd, check=True)
+            break
+        except subprocess.CalledProcessError as e:
+            if i + 1 == len(video_variants):
+                raise
+            print(f"Warning: {video_args[1]} HLS encode failed ({e}); retrying with libx264")
     print(f"✅ Added {batch_file} → {playlist_path} & segments")
 
 
@@ -1,33 +1,50 @@
 import os
 from pathlib import Path
+import cv2
+import functools
 import yaml
 import re
 
+# LibYAML's C parser when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# Formats for frames handed between pipeline stages: JPEG (libjpeg-turbo inside OpenCV) encodes several
+# times faster than PNG's zlib; PNG stays available when lossless matters
+FRAME_EXTS = (".png", ".jpg", ".jpeg")
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 92]
+
 def ensure_dirs(*paths):
     for p in paths:
         Path(p).mkdir(parents=True, exist_ok=True)
 
+_ENV_RE = re.compile(r'\$\{([^:}]+):?([^}]*)\}')
+
+def _replace_env_var(match):
+    return os.getenv(match.group(1), match.group(2) or "")
+
 def substitute_env_vars(text):
     """Substitute environment variables in text like ${VAR:default}"""
-    if isinstance(text, str):
-        def replace_var(match):
-            var_name = match.group(1)
-            default_value = match.group(2) if match.group(2) else ""
-            return os.getenv(var_name, default_value)
-        return re.sub(r'\$\{([^:}]+):?([^}]*)\}', replace_var, text)
+    if isinstance(text, str) and "${" in text:
+        return _ENV_RE.sub(_replace_env_var, text)
     return text
 
+@functools.lru_cache(maxsize=4)
+def _parse_yaml(path, mtime):
+    # mtime is only part of the cache key, so an edited file is parsed again
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
 def load_config(path="config.yaml"):
-    # Try to open the config file in the current directory
-    try:
-        with open(path, "r") as f:
-            config = yaml.safe_load(f)
-    except FileNotFoundError:
-        # If not found, try the parent directory
+    # Try the config file in the current directory, else the parent directory
+    if not os.path.exists(path):
         parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        config_path = os.path.join(parent_dir, path)
-        with open(config_path, "r") as f:
-            config = yaml.safe_load(f)
+        path = os.path.join(parent_dir, path)
+    path = os.path.abspath(path)
+    # The parsed YAML is cached; env vars are substituted on every call since they may change
+    config = _parse_yaml(path, os.stat(path).st_mtime_ns)
     
     # Substitute environment variables in the config
     def process_config(obj):
@@ -40,5 +57,31 @@ def load_config(path="config.yaml"):
     
     return process_config(config)
 
-def sorted_files(folder, exts=(".png", ".jpg", ".jpeg")):
-    return sorted([f for f in os.listdir(folder) if f.lower().endswith(exts)])
+def write_frame(path, frame):
+    """Write a BGR frame, choosing the codec from the extension (.jpg/.jpeg or any cv2 format)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jpg", ".jpeg"):
+        return cv2.imwrite(path, frame, JPEG_PARAMS)
+    return cv2.imwrite(path, frame)
+
+def encode_frame(path, frame):
+    """Encode a frame to the bytes write_frame would put at path, so the file write can happen elsewhere."""
+    ext = os.path.splitext(path)[1].lower()
+    ok, buf = cv2.imencode(ext, frame, JPEG_PARAMS if ext in (".jpg", ".jpeg") else [])
+    if not ok:
+        raise ValueError(f"Could not encode frame for {path}")
+    return buf.tobytes()
+
+def read_frame(path):
+    """Counterpart of write_frame."""
+    return cv2.imread(path)
+
+def sorted_files(folder, exts=FRAME_EXTS):
+    # scandir's DirEntry answers is_file() from the directory listing, without a stat per name
+    with os.scandir(folder) as it:
+        return sorted(e.name for e in it if e.name.lower().endswith(exts) and e.is_file())
+
+def sorted_entries(folder, exts=FRAME_EXTS):
+    """Like sorted_files, but one os.scandir pass returning DirEntry objects (use e.path / e.name)."""
+    with os.scandir(folder) as it:
+        return sorted((e for e in it if e.name.lower().endswith(exts)), key=lambda e: e.name)
@@ -1,14 +1,9 @@
 import cv2
-import os
-import sys
-from pathlib import Path
+import json
 import subprocess
-
-# Handle imports for both direct execution and module import
-try:
-    from .utils import ensure_dirs
-except ImportError:
-    from utils import ensure_dirs
+import queue
+import threading
+import numpy as np
 
 def extract_audio(input_video, out_audio):
     """Extract original audio track to out_audio (wav or m4a)."""
@@ -18,36 +13,167 @@ def extract_audio(input_video, out_audio):
     ]
     subprocess.run(cmd, check=True)
 
-def read_and_write_batches(input_video, frames_out_dir, batch_size=30):
-    """
-    Read video, write frames in batches.
-    Returns: list of tuples -> [(batch_idx, start_frame, end_frame, frames_paths_list), ...]
-    """
-    ensure_dirs(frames_out_dir)
+def _open_video(input_video, sample_fps=None):
     cap = cv2.VideoCapture(input_video)
     fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
     total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    step = fps / sample_fps if sample_fps and sample_fps < fps else 1.0
+    return cap, step, fps, total, w, h
 
-    batches = []
-    frame_idx = 0
-    batch_idx = 0
-    current_batch = []
+def _kept_frames(cap, step):
+    """
+    Yield decoded frames, skipping to match the sampling step.
+    Skipped frames are only grab()bed, which still decodes them but skips the BGR conversion and copy; retrieve() runs just for the frames that are kept.
+    """
+    src_idx = 0
+    next_keep = 0.0
     while True:
-        ret, frame = cap.read()
+        if not cap.grab():
+            break
+        keep = src_idx >= next_keep
+        src_idx += 1
+        if not keep:
+            continue
+        next_keep += step
+        ret, frame = cap.retrieve()
         if not ret:
             break
-        fname = f"frame_{frame_idx:06d}.png"
-        outpath = os.path.join(frames_out_dir, fname)
-        cv2.imwrite(outpath, frame)
-        current_batch.append(outpath)
+        yield frame
+
+def _prefetch(items, maxsize):
+    """
+    Drain the items iterator on a reader thread, buffering up to maxsize results so the producer
+    runs ahead of the consumer without unbounded memory (the bounded queue gives back-pressure).
+    Exceptions from the producer are re-raised in the consumer. When the consumer stops early the
+    reader thread is told to stop and joined before items is closed, so whatever items holds open
+    (capture, ffmpeg pipe) is never released while the thread is still reading from it.
+    """
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def _put(entry):
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for item in items:
+                if not _put((True, item)):
+                    return
+            _put((False, None))
+        except BaseException as e:
+            _put((False, e))
+
+    reader = threading.Thread(target=_produce, daemon=True)
+    reader.start()
+    try:
+        while True:
+            ok, item = q.get()
+            if not ok:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        reader.join()
+        if hasattr(items, "close"):
+            items.close()
+
+def _batched(items, batch_size):
+    batch_idx = 0
+    frame_idx = 0
+    current_batch = []
+    for item in items:
+        current_batch.append(item)
         frame_idx += 1
         if len(current_batch) >= batch_size:
-            batches.append((batch_idx, frame_idx - len(current_batch), frame_idx-1, list(current_batch)))
+            yield (batch_idx, frame_idx - len(current_batch), frame_idx-1, current_batch)
             batch_idx += 1
             current_batch = []
     if current_batch:
-        batches.append((batch_idx, frame_idx - len(current_batch), frame_idx-1, list(current_batch)))
-    cap.release()
-    return batches, fps, total, w, h
+        yield (batch_idx, frame_idx - len(current_batch), frame_idx-1, current_batch)
+
+def _probe_display_size(input_video):
+    """(width, height) of the first video stream as ffmpeg outputs it, i.e. after autorotation."""
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
+        "-of", "json", input_video,
+    ]
+    info = json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout)["streams"][0]
+    rotation = int(info.get("tags", {}).get("rotate", 0) or 0)
+    for side_data in info.get("side_data_list", []):
+        if "rotation" in side_data:
+            rotation = int(side_data["rotation"])
+    w, h = int(info["width"]), int(info["height"])
+    return (h, w) if rotation % 180 else (w, h)
+
+def _ffmpeg_frames(input_video, w, h, sample_fps, src_fps):
+    """
+    Decode with one ffmpeg process piping raw BGR frames: threaded decode and SIMD colour conversion,
+    with no per-frame Python decode loop. Frames land in fresh writable buffers.
+    """
+    cmd = ["ffmpeg", "-v", "error", "-i", input_video]
+    if sample_fps and sample_fps < src_fps:
+        cmd += ["-vf", f"fps={sample_fps}"]
+    else:
+        cmd += ["-fps_mode", "passthrough"]
+    cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+    frame_bytes = w * h * 3
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=frame_bytes)
+    try:
+        while True:
+            buf = bytearray(frame_bytes)
+            if proc.stdout.readinto(buf) < frame_bytes:
+                break
+            yield np.frombuffer(buf, dtype=np.uint8).reshape(h, w, 3)
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+def read_batches(input_video, batch_size=30, sample_fps=None, use_ffmpeg=True):
+    """
+    Read video into in-memory batches of decoded frames; nothing is written to disk.
+    With use_ffmpeg a single ffmpeg process decodes and pipes raw frames; otherwise (or when ffprobe fails)
+    the OpenCV VideoCapture is used. Either way a reader thread decodes the next batch while the current
+    one is processed.
+    Returns: (batches_iter, fps, total, w, h) where batches_iter yields (batch_idx, start_frame, end_frame, [ndarray, ...])
+    """
+    cap, step, fps, total, w, h = _open_video(input_video, sample_fps)
+
+    frames = None
+    if use_ffmpeg:
+        try:
+            w, h = _probe_display_size(input_video)
+        except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError) as e:
+            print(f"Warning: ffprobe failed ({e}); decoding with OpenCV")
+        else:
+            cap.release()
+            frames = _ffmpeg_frames(input_video, w, h, sample_fps, fps)
+    if frames is None:
+        frames = _kept_frames(cap, step)
+
+    def _iter():
+        try:
+            yield from _batched(frames, batch_size)
+        finally:
+            frames.close()
+            cap.release()
+    return _prefetch(_iter(), maxsize=1), fps, total, w, h